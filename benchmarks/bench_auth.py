@@ -0,0 +1,74 @@
+"""
+Latency of Auth.get_current_user with the in-process L1 cache on and off.
+Needs the Redis configured in settings; the user is read from a throwaway SQLite database.
+
+    python -m benchmarks.bench_auth --requests 10000
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from src.database.models import Base, User
+from src.services import cache
+from src.services.auth import auth_service
+
+
+def percentile(timings: list, q: float) -> float:
+    """
+    The percentile function returns the q-th percentile of the timings.
+
+    :param timings: list: Latencies
+    :param q: float: Percentile between 0 and 100
+    :return: The percentile
+    """
+    ordered = sorted(timings)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q / 100))]
+
+
+async def measure(token: str, db, requests: int, l1: bool) -> list:
+    """
+    The measure function authenticates the same token repeatedly and returns the latencies in milliseconds.
+
+    :param token: str: Access token
+    :param db: AsyncSession: Database session
+    :param requests: int: Number of authentications
+    :param l1: bool: Whether the in-process cache is enabled
+    :return: A list of latencies
+    """
+    for local in (cache.token_l1, cache.user_l1):
+        local.clear()
+        local.hits = local.misses = 0
+        local.maxsize = cache.settings.l1_cache_size if l1 else 0
+    timings = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        await auth_service.get_current_user(token, db)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=10000)
+    args = parser.parse_args()
+
+    engine = create_async_engine('sqlite+aiosqlite://')
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+    async with async_sessionmaker(engine, expire_on_commit=False)() as db:
+        db.add(User(username='bench', email='bench@example.com', password='hash', confirmed=True))
+        await db.commit()
+        token = await auth_service.create_access_token(data={'sub': 'bench@example.com'}, expires_delta=None)
+        await cache.invalidate_user('bench@example.com')
+        for l1 in (False, True):
+            timings = await measure(token, db, args.requests, l1)
+            print(f"L1 {'on ' if l1 else 'off'} p50={statistics.median(timings):.3f}ms "
+                  f"p99={percentile(timings, 99):.3f}ms {cache.cache_stats()}")
+    await engine.dispose()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
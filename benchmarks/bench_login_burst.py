@@ -0,0 +1,74 @@
+"""
+Event loop responsiveness during a burst of password verifications.
+
+A probe task sleeps 10 ms in a loop and records how late it wakes up: that lateness is the extra
+latency every other route on the worker would see. The burst is run once with bcrypt inline
+(the old behaviour) and once through Auth.verify_password on the password executor.
+
+    python -m benchmarks.bench_login_burst --logins 200
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from fastapi import HTTPException
+
+from src.services.auth import auth_service
+
+PROBE_INTERVAL = 0.01
+
+
+async def probe(delays: list, stop: asyncio.Event):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(PROBE_INTERVAL)
+        delays.append((time.perf_counter() - start - PROBE_INTERVAL) * 1000)
+
+
+async def inline_login(hashed: str):
+    auth_service.pwd_context.verify('0987654321', hashed)
+
+
+async def offloaded_login(hashed: str):
+    try:
+        await auth_service.verify_password('0987654321', hashed)
+    except HTTPException:
+        return 'rejected'
+
+
+async def burst(login, hashed: str, logins: int):
+    """
+    The burst function runs the logins concurrently next to the probe and reports the probe lateness.
+
+    :param login: Coroutine function performing one login
+    :param hashed: str: Password hash to verify against
+    :param logins: int: Number of concurrent logins
+    :return: The probe lateness in milliseconds, the wall time and the number of rejected logins
+    """
+    delays = []
+    stop = asyncio.Event()
+    probe_task = asyncio.create_task(probe(delays, stop))
+    await asyncio.sleep(PROBE_INTERVAL * 3)
+    start = time.perf_counter()
+    results = await asyncio.gather(*(login(hashed) for _ in range(logins)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await probe_task
+    return delays, elapsed, results.count('rejected')
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--logins', type=int, default=200)
+    args = parser.parse_args()
+
+    hashed = auth_service.pwd_context.hash('0987654321')
+    for name, login in (('inline', inline_login), ('executor', offloaded_login)):
+        delays, elapsed, rejected = await burst(login, hashed, args.logins)
+        print(f'{name:9} logins={args.logins} rejected={rejected} wall={elapsed:.2f}s '
+              f'probe lateness p50={statistics.median(delays):.1f}ms max={max(delays):.1f}ms')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
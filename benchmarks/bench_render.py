@@ -0,0 +1,79 @@
+"""
+Throughput of building verification emails: the per-message path fastapi_mail took (a new Jinja
+environment, template lookup and EmailMessage for every send) against the precompiled templates
+and bulk API of src.services.send_email.
+
+    python -m benchmarks.bench_render --messages 10000
+"""
+import argparse
+import time
+from email.message import EmailMessage
+
+from src.services import send_email
+
+TEMPLATE = 'email_template.html'
+
+
+def context(number: int) -> dict:
+    """
+    The context function returns the template variables of the verification email of one user.
+
+    :param number: int: Number of the user
+    :return: The template variables
+    """
+    return {'host': 'http://localhost:8000/', 'username': f'user{number}', 'token': f'token{number}'}
+
+
+def per_message(messages: int) -> None:
+    """
+    The per_message function builds messages the way send_email did through FastMail.send_message.
+
+    :param messages: int: Number of messages
+    :return: None
+    """
+    for number in range(messages):
+        template = send_email.mail_config().template_engine().get_template(TEMPLATE)
+        message = EmailMessage()
+        message['Subject'] = 'Confirm your email '
+        message['From'] = send_email.SENDER
+        message['To'] = f'user{number}@example.com'
+        message.set_content(template.render(**context(number)), subtype='html')
+
+
+def bulk(messages: int) -> None:
+    """
+    The bulk function builds messages with send_email.build_messages.
+
+    :param messages: int: Number of messages
+    :return: None
+    """
+    for _ in send_email.build_messages('Confirm your email ', TEMPLATE, (
+            (f'user{number}@example.com', context(number)) for number in range(messages))):
+        pass
+
+
+def render_only(messages: int) -> None:
+    """
+    The render_only function renders the bodies with send_email.render_many, without building messages.
+
+    :param messages: int: Number of messages
+    :return: None
+    """
+    for _ in send_email.render_many(TEMPLATE, (context(number) for number in range(messages))):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=10000)
+    args = parser.parse_args()
+
+    for name, run in (('per message', per_message), ('build_messages', bulk), ('render_many', render_only)):
+        start = time.perf_counter()
+        run(args.messages)
+        elapsed = time.perf_counter() - start
+        print(f'{name:15} messages={args.messages} {elapsed:7.2f}s {args.messages / elapsed:10.0f}/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+Time to load and serialize a list of contacts the way GET /api/contacts/all does:
+ORM objects validated through ContactResponse and encoded by JSONResponse (the default),
+against rows of the response columns encoded by orjson and by the standard library (settings.fast_json).
+
+    python -m benchmarks.bench_serialize --contacts 10000
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from src.database.db import SyncSessionAdapter
+from src.database.models import User
+from src.repository.contacts import get_contacts, RESPONSE_COLUMNS
+from src.services import serializer
+from benchmarks.bench_search import seed
+
+
+def measure(render, repeat: int) -> list:
+    """
+    The measure function runs render several times and returns the latencies in milliseconds.
+
+    :param render: Function returning a JSON body
+    :param repeat: int: Number of runs
+    :return: A list of latencies
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        render()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--contacts', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    engine = create_engine('sqlite://')
+    seed(engine, args.contacts)
+    session = SyncSessionAdapter(sessionmaker(bind=engine)())
+    user = User(id=None)
+
+    def load(columns):
+        session.expunge_all()
+        return asyncio.run(get_contacts(user, session, columns=columns))
+
+    contacts, rows = load(None), load(RESPONSE_COLUMNS)
+    orjson = serializer.orjson
+    runs = (
+        ('pydantic + json', False, None, lambda: serializer.render_contacts(contacts)),
+        ('rows + orjson', True, orjson, lambda: serializer.render_contacts(rows)),
+        ('rows + json', True, None, lambda: serializer.render_contacts(rows)),
+        ('load + pydantic + json', False, None, lambda: serializer.render_contacts(load(None))),
+        ('load rows + orjson', True, orjson, lambda: serializer.render_contacts(load(RESPONSE_COLUMNS))),
+    )
+    bodies = set()
+    for name, fast_json, encoder, render in runs:
+        if fast_json and encoder is None and name.endswith('orjson'):
+            print(f'{name:23} skipped, orjson is not installed')
+            continue
+        serializer.settings.fast_json, serializer.orjson = fast_json, encoder
+        bodies.add(render())
+        timings = measure(render, args.repeat)
+        print(f'{name:23} contacts={args.contacts} p50={statistics.median(timings):8.2f}ms '
+              f'min={min(timings):8.2f}ms')
+    serializer.orjson = orjson
+    print('identical output' if len(bodies) == 1 else 'OUTPUT DIFFERS')
+    asyncio.run(session.close())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""
+Cold start of a worker: how long a fresh interpreter takes to import main and which imports
+the time goes to, from the report of python -X importtime. Several runs are made and the fastest one
+is reported, since the first run also pays for reading the files from disk.
+
+    python -m benchmarks.bench_startup --runs 5 --top 20
+    python -X importtime -c "import main" 2> importtime.txt    # the raw report
+"""
+import argparse
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def import_times(module: str = 'main') -> list[tuple[int, int, str]]:
+    """
+    The import_times function imports a module in a new interpreter with -X importtime.
+
+    :param module: str: Name of the module to import
+    :return: Self and cumulative microseconds and the indented name of every imported module, in import order
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            cwd=ROOT, capture_output=True, text=True, check=True)
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or line.endswith('| imported package'):
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        entries.append((int(own), int(cumulative), name.rstrip()))
+    return entries
+
+
+def own_entries(entries: list[tuple[int, int, str]], module: str = 'main') -> list[tuple[int, int, str]]:
+    """
+    The own_entries function keeps the imports made by the module, dropping those of the interpreter start.
+    The report lists a module after everything it imported, so they are the lines since the previous top level one.
+
+    :param entries: list[tuple[int, int, str]]: The output of import_times
+    :param module: str: Name of the imported module
+    :return: The entries of the module, the module itself last
+    """
+    end = next(index for index, (_, _, name) in enumerate(entries) if name == f' {module}')
+    start = end
+    while start > 0 and entries[start - 1][2].startswith('  '):
+        start -= 1
+    return entries[start:end + 1]
+
+
+def total_ms(entries: list[tuple[int, int, str]], module: str = 'main') -> float:
+    """
+    The total_ms function returns the time it took to import the module, with everything it imported.
+
+    :param entries: list[tuple[int, int, str]]: The output of import_times
+    :param module: str: Name of the imported module
+    :return: The import time in milliseconds
+    """
+    return next(cumulative for _, cumulative, name in entries if name == f' {module}') / 1000
+
+
+def report(entries: list[tuple[int, int, str]], module: str = 'main', top: int = 20) -> str:
+    """
+    The report function summarizes an import profile: the total, the slowest packages imported directly
+    by the module or at the top level of the project, and the modules that are slow on their own.
+
+    :param entries: list[tuple[int, int, str]]: The output of import_times
+    :param module: str: Name of the imported module
+    :param top: int: Number of modules in each list
+    :return: The report
+    """
+    entries = own_entries(entries, module)
+    lines = [f'import {module}: {total_ms(entries, module):.1f} ms', '', 'Slowest imports (cumulative ms):']
+    # Depth 2 are the imports of the module itself; src.* modules are listed at any depth
+    direct = [(cumulative, name.strip()) for _, cumulative, name in entries
+              if name.startswith('   ') and not name.startswith('    ') or name.strip().startswith('src.')]
+    for cumulative, name in sorted(direct, reverse=True)[:top]:
+        lines.append(f'{cumulative / 1000:9.1f}  {name}')
+    lines += ['', 'Slowest modules on their own (self ms):']
+    for own, _, name in sorted(entries, reverse=True)[:top]:
+        lines.append(f'{own / 1000:9.1f}  {name.strip()}')
+    return '\n'.join(lines) + '\n'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--module', default='main')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=20)
+    args = parser.parse_args()
+
+    runs = [import_times(args.module) for _ in range(args.runs)]
+    print(f"runs: {', '.join(f'{total_ms(entries, args.module):.0f}' for entries in runs)} ms")
+    print(report(min(runs, key=lambda entries: total_ms(entries, args.module)), args.module, args.top))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""
+In-memory stand-in for the redis.asyncio commands the application uses, for running the load tests
+on one machine without a Redis server. It lives in the worker process, so it is only equivalent
+to Redis with a single worker; it answers without a network round trip, which leaves Redis latency
+out of the measurements.
+"""
+import asyncio
+import time
+
+
+class FakePipeline:
+    def __init__(self, redis: 'FakeRedis'):
+        self.redis = redis
+        self.commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        self.commands = []
+
+    def __getattr__(self, name: str):
+        def queue(*args, **kwargs):
+            self.commands.append((name, args, kwargs))
+            return self
+        return queue
+
+    async def execute(self) -> list:
+        commands, self.commands = self.commands, []
+        return [await getattr(self.redis, name)(*args, **kwargs) for name, args, kwargs in commands]
+
+
+class FakePubSub:
+    def __init__(self, redis: 'FakeRedis'):
+        self.redis = redis
+        self.messages = asyncio.Queue()
+        self.channels = set()
+
+    async def subscribe(self, *channels: str) -> None:
+        self.channels.update(channels)
+        self.redis.subscribers.add(self)
+
+    async def listen(self):
+        while True:
+            yield await self.messages.get()
+
+    async def reset(self) -> None:
+        self.redis.subscribers.discard(self)
+        self.channels.clear()
+
+
+class FakeConnectionPool:
+    async def disconnect(self) -> None:
+        pass
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+        self.expires = {}
+        self.subscribers = set()
+        self.connection_pool = FakeConnectionPool()
+
+    def _get(self, key: str):
+        expires = self.expires.get(key)
+        if expires is not None and expires <= time.monotonic():
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        return self.data.get(key)
+
+    async def ping(self) -> bool:
+        return True
+
+    async def close(self) -> None:
+        pass
+
+    async def get(self, key: str):
+        return self._get(key)
+
+    async def set(self, key: str, value, ex: int | None = None) -> bool:
+        self.data[key] = str(value)
+        self.expires.pop(key, None)
+        if ex is not None:
+            self.expires[key] = time.monotonic() + ex
+        return True
+
+    async def delete(self, *keys: str) -> int:
+        return sum(self.data.pop(key, None) is not None for key in keys)
+
+    async def incrby(self, key: str, amount: int = 1) -> int:
+        value = int(self._get(key) or 0) + amount
+        self.data[key] = str(value)
+        return value
+
+    async def incr(self, key: str) -> int:
+        return await self.incrby(key)
+
+    async def expire(self, key: str, seconds: int) -> bool:
+        if self._get(key) is None:
+            return False
+        self.expires[key] = time.monotonic() + seconds
+        return True
+
+    async def hset(self, key: str, mapping: dict) -> int:
+        value = self._get(key)
+        if value is None:
+            value = self.data[key] = {}
+        value.update({field: str(item) for field, item in mapping.items()})
+        return len(mapping)
+
+    async def hgetall(self, key: str) -> dict:
+        return dict(self._get(key) or {})
+
+    async def publish(self, channel: str, message: str) -> int:
+        receivers = [pubsub for pubsub in self.subscribers if channel in pubsub.channels]
+        for pubsub in receivers:
+            pubsub.messages.put_nowait({'type': 'message', 'channel': channel, 'data': message})
+        return len(receivers)
+
+    def pipeline(self, transaction: bool = True) -> FakePipeline:
+        return FakePipeline(self)
+
+    def pubsub(self) -> FakePubSub:
+        return FakePubSub(self)
@@ -1,16 +1,19 @@
+import asyncio
 import time
+from contextlib import asynccontextmanager
 
-import uvicorn
-import redis.asyncio as redis
 from fastapi import FastAPI, Request, Depends, HTTPException, status
-from fastapi_limiter import FastAPILimiter
+from fastapi.staticfiles import StaticFiles
 from sqlalchemy import text
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from starlette.middleware.cors import CORSMiddleware
 
-from src.database.db import get_db
-from src.routes import auth, contacts, users
 from src.config.config import settings
+from src.database.db import get_db, pool_status
+from src.routes import auth, contacts, users
+from src.services import cache
+from src.services.rate_limit import limiter
+from src.services.resources import resources
 
 
 app = FastAPI()
@@ -32,25 +35,35 @@ app.include_router(auth.router, prefix='/api')
 app.include_router(contacts.router, prefix='/api')
 app.include_router(users.router, prefix='/api')
 
+if settings.avatar_storage == 'local':
+    app.mount(settings.avatar_local_url, StaticFiles(directory=settings.avatar_local_dir, check_dir=False),
+              name='avatars')
 
-@app.on_event("startup")
-async def startup():
-    """
-    The startup function is called when the application starts.
-    It's a good place to initialize things that are used by the app, such as databases or caches.
-    Since we are making an async function so we need to add async keyword before the def keyword and
-    we need to await the results of async tasks inside this function.
 
-    :return: A dictionary with the following keys:
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    The lifespan function runs once per worker around the requests it serves.
+    Before traffic it opens the shared Redis and database clients with a few connections already established
+    and starts the mail queue, then the listener of user cache invalidations and the rate limiter sync.
+    On shutdown it stops them and closes the resources, which gives the mail queue a few seconds
+    to send what is still queued.
+
+    :param app: FastAPI: The application
+    :return: None
     """
-    r = await redis.Redis(
-        host=settings.redis_host,
-        port=settings.redis_port,
-        db=0,
-        encoding="utf-8",
-        decode_responses=True
-    )
-    await FastAPILimiter.init(r)
+    await resources.open()
+    tasks = [asyncio.create_task(cache.listen_invalidations()), asyncio.create_task(limiter.run())]
+    try:
+        yield
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await resources.close()
+
+
+app.router.lifespan_context = lifespan
 
 
 @app.get("/", name="Main page")
@@ -81,19 +94,19 @@ async def add_process_time_header(request: Request, call_next):
 
 
 @app.get("/api/healthchecker")
-def healthchecker(db: Session = Depends(get_db)):
+async def healthchecker(db: AsyncSession = Depends(get_db)):
     """
     The healthchecker function is a simple function that checks if the database is configured correctly.
     It does this by making a request to the database and checking if it returns any results. If it doesn't,
     it raises an HTTPException with status code 500 (Internal Server Error) and detail &quot;Database is not
     configured correctly&quot;. If there are no errors, then it returns {&quot;message&quot;: &quot;Hello! FastAPI Homework 2.12&quot;}.
 
-    :param db: Session: Pass the database session to the function
+    :param db: AsyncSession: Pass the database session to the function
     :return: A dictionary with the message &quot;hello! fastapi homework 2
     """
     try:
         # Make request
-        result = db.execute(text("SELECT 1")).fetchone()
+        result = (await db.execute(text("SELECT 1"))).fetchone()
         print(result)
         if result is None:
             raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -105,5 +118,51 @@ def healthchecker(db: Session = Depends(get_db)):
                             detail="Error connecting to the database")
 
 
+@app.get("/api/healthchecker/pool")
+def pool_metrics():
+    """
+    The pool_metrics function returns the state of the database connection pool of this worker:
+    size, checked out, idle and overflow connections and the checkout wait time, for sizing pools per worker.
+
+    :return: A dictionary of pool counters
+    """
+    return pool_status()
+
+
+@app.get("/api/healthchecker/cache")
+def cache_metrics():
+    """
+    The cache_metrics function returns the size and hit/miss counters of this worker's in-process
+    token and user caches.
+
+    :return: A dictionary of cache counters
+    """
+    return cache.cache_stats()
+
+
+@app.get("/api/healthchecker/mail")
+def mail_metrics():
+    """
+    The mail_metrics function returns the depth of this worker's outgoing mail queue, its delivery
+    counters and the latency from queueing to a successful send.
+
+    :return: A dictionary of mail queue counters
+    """
+    return resources.mail.stats()
+
+
+@app.get("/api/healthchecker/rate_limit")
+def rate_limit_metrics():
+    """
+    The rate_limit_metrics function returns the number of rate limit keys this worker tracks
+    and its counters of allowed and rejected requests and of Redis syncs.
+
+    :return: A dictionary of rate limiter counters
+    """
+    return limiter.stats()
+
+
 if __name__ == '__main__':
+    import uvicorn
+
     uvicorn.run(app="main:app", reload=True)
@@ -0,0 +1,28 @@
+"""Indexes for the contacts and users lookups
+
+Revision ID: 0bce98074f4f
+Revises: fa5db3c08cd3
+Create Date: 2026-10-18 15:42:09.518337
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0bce98074f4f'
+down_revision = 'fa5db3c08cd3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_contacts_user_id_id', 'contacts', ['user_id', 'id'], unique=False)
+    op.create_index('ix_contacts_birthday_md', 'contacts', ['birthday_md'], unique=False)
+    op.create_index(op.f('ix_users_username'), 'users', ['username'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_users_username'), table_name='users')
+    op.drop_index('ix_contacts_birthday_md', table_name='contacts')
+    op.drop_index('ix_contacts_user_id_id', table_name='contacts')
@@ -0,0 +1,44 @@
+"""Per-user contacts lookups
+
+Revision ID: 3e7a1d52b9c0
+Revises: 0bce98074f4f
+Create Date: 2026-10-18 18:05:27.104392
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3e7a1d52b9c0'
+down_revision = '0bce98074f4f'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.drop_index('ix_contacts_birthday_md', table_name='contacts')
+    if op.get_bind().dialect.name == 'sqlite':
+        op.execute('DROP TRIGGER IF EXISTS contacts_fts_au')
+        op.execute('DROP TRIGGER IF EXISTS contacts_fts_ad')
+        op.execute('DROP TRIGGER IF EXISTS contacts_fts_ai')
+        op.execute('DROP TABLE IF EXISTS contacts_fts')
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name == 'sqlite':
+        op.execute("CREATE VIRTUAL TABLE IF NOT EXISTS contacts_fts USING fts5("
+                   "name, surname, email, phone, content='contacts', content_rowid='id', tokenize='trigram')")
+        op.execute("CREATE TRIGGER IF NOT EXISTS contacts_fts_ai AFTER INSERT ON contacts BEGIN "
+                   "INSERT INTO contacts_fts(rowid, name, surname, email, phone) "
+                   "VALUES (new.id, new.name, new.surname, new.email, new.phone); END")
+        op.execute("CREATE TRIGGER IF NOT EXISTS contacts_fts_ad AFTER DELETE ON contacts BEGIN "
+                   "INSERT INTO contacts_fts(contacts_fts, rowid, name, surname, email, phone) "
+                   "VALUES ('delete', old.id, old.name, old.surname, old.email, old.phone); END")
+        op.execute("CREATE TRIGGER IF NOT EXISTS contacts_fts_au AFTER UPDATE ON contacts BEGIN "
+                   "INSERT INTO contacts_fts(contacts_fts, rowid, name, surname, email, phone) "
+                   "VALUES ('delete', old.id, old.name, old.surname, old.email, old.phone); "
+                   "INSERT INTO contacts_fts(rowid, name, surname, email, phone) "
+                   "VALUES (new.id, new.name, new.surname, new.email, new.phone); END")
+        op.execute("INSERT INTO contacts_fts(contacts_fts) VALUES ('rebuild')")
+    op.create_index('ix_contacts_birthday_md', 'contacts', ['birthday_md'], unique=False)
@@ -0,0 +1,54 @@
+"""Contacts search indexes
+
+Revision ID: c92922c66479
+Revises: 59b0f66059fd
+Create Date: 2026-10-18 10:12:41.518364
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c92922c66479'
+down_revision = '59b0f66059fd'
+branch_labels = None
+depends_on = None
+
+SEARCH_COLUMNS = ('name', 'surname', 'email', 'phone')
+
+
+def upgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        for column in SEARCH_COLUMNS:
+            op.create_index(f'ix_contacts_{column}_trgm', 'contacts', [column], unique=False,
+                            postgresql_using='gin', postgresql_ops={column: 'gin_trgm_ops'})
+    elif dialect == 'sqlite':
+        op.execute("CREATE VIRTUAL TABLE IF NOT EXISTS contacts_fts USING fts5("
+                   "name, surname, email, phone, content='contacts', content_rowid='id', tokenize='trigram')")
+        op.execute("CREATE TRIGGER IF NOT EXISTS contacts_fts_ai AFTER INSERT ON contacts BEGIN "
+                   "INSERT INTO contacts_fts(rowid, name, surname, email, phone) "
+                   "VALUES (new.id, new.name, new.surname, new.email, new.phone); END")
+        op.execute("CREATE TRIGGER IF NOT EXISTS contacts_fts_ad AFTER DELETE ON contacts BEGIN "
+                   "INSERT INTO contacts_fts(contacts_fts, rowid, name, surname, email, phone) "
+                   "VALUES ('delete', old.id, old.name, old.surname, old.email, old.phone); END")
+        op.execute("CREATE TRIGGER IF NOT EXISTS contacts_fts_au AFTER UPDATE ON contacts BEGIN "
+                   "INSERT INTO contacts_fts(contacts_fts, rowid, name, surname, email, phone) "
+                   "VALUES ('delete', old.id, old.name, old.surname, old.email, old.phone); "
+                   "INSERT INTO contacts_fts(rowid, name, surname, email, phone) "
+                   "VALUES (new.id, new.name, new.surname, new.email, new.phone); END")
+        op.execute("INSERT INTO contacts_fts(contacts_fts) VALUES ('rebuild')")
+
+
+def downgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        for column in SEARCH_COLUMNS:
+            op.drop_index(f'ix_contacts_{column}_trgm', table_name='contacts')
+    elif dialect == 'sqlite':
+        op.execute('DROP TRIGGER IF EXISTS contacts_fts_au')
+        op.execute('DROP TRIGGER IF EXISTS contacts_fts_ad')
+        op.execute('DROP TRIGGER IF EXISTS contacts_fts_ai')
+        op.execute('DROP TABLE IF EXISTS contacts_fts')
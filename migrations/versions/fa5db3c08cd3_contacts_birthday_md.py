@@ -0,0 +1,31 @@
+"""Contacts birthday month/day key
+
+Revision ID: fa5db3c08cd3
+Revises: c92922c66479
+Create Date: 2026-10-18 11:03:27.204715
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'fa5db3c08cd3'
+down_revision = 'c92922c66479'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('contacts', sa.Column('birthday_md', sa.Integer(), nullable=True))
+    if op.get_bind().dialect.name == 'sqlite':
+        op.execute("UPDATE contacts SET birthday_md = CAST(strftime('%m%d', birthday) AS INTEGER)")
+    else:
+        op.execute('UPDATE contacts SET birthday_md = '
+                   'EXTRACT(MONTH FROM birthday) * 100 + EXTRACT(DAY FROM birthday)')
+    op.create_index('ix_contacts_user_id_birthday_md', 'contacts', ['user_id', 'birthday_md'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_contacts_user_id_birthday_md', table_name='contacts')
+    op.drop_column('contacts', 'birthday_md')
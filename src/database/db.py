@@ -1,25 +1,322 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+import asyncio
+import time
+
+from sqlalchemy import Engine, create_engine, make_url
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine, async_sessionmaker
+from sqlalchemy.orm import sessionmaker, Session
 
 from src.config.config import settings
 
 SQLALCHEMY_DATABASE_URL = settings.sqlalchemy_database_url
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+ASYNC_DRIVERS = {
+    'postgresql': 'postgresql+asyncpg',
+    'sqlite': 'sqlite+aiosqlite',
+}
+
+
+def to_async_url(url: str) -> str:
+    """
+    The to_async_url function swaps the DBAPI driver of a database URL for its asyncio counterpart,
+    e.g. postgresql+psycopg2 for postgresql+asyncpg and sqlite for sqlite+aiosqlite.
+
+    :param url: str: Synchronous database URL
+    :return: The same URL with an async driver
+    """
+    url = make_url(url)
+    return url.set(drivername=ASYNC_DRIVERS.get(url.get_backend_name(), url.drivername)) \
+        .render_as_string(hide_password=False)
+
+
+class _TimedPoolMixin:
+    """
+    Records how long callers wait for a connection in the pool's checkout.
+    """
+    checkouts = 0
+    wait_total = 0.0
+    wait_max = 0.0
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            wait = time.perf_counter() - start
+            self.checkouts += 1
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+
+
+class TimedQueuePool(_TimedPoolMixin, QueuePool):
+    pass
+
+
+class TimedAsyncAdaptedQueuePool(_TimedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def engine_options(url: str, is_async: bool = False) -> dict:
+    """
+    The engine_options function builds the create_engine keyword arguments for the pool from settings:
+    size, overflow, checkout timeout, recycle, pre-ping and the PostgreSQL statement_timeout.
+        SQLite keeps SQLAlchemy's default pool, which is picked per database (file or memory).
+
+    :param url: str: Database URL the engine is created for
+    :param is_async: bool: Whether the engine runs on an asyncio driver
+    :return: A dictionary of keyword arguments
+    """
+    backend = make_url(url).get_backend_name()
+    if backend == 'sqlite':
+        return {}
+    options = {
+        'poolclass': TimedAsyncAdaptedQueuePool if is_async else TimedQueuePool,
+        'pool_size': settings.db_pool_size,
+        'max_overflow': settings.db_max_overflow,
+        'pool_timeout': settings.db_pool_timeout,
+        'pool_recycle': settings.db_pool_recycle,
+        'pool_pre_ping': settings.db_pool_pre_ping,
+    }
+    if backend == 'postgresql' and settings.db_statement_timeout:
+        if is_async:
+            options['connect_args'] = {'server_settings': {'statement_timeout': str(settings.db_statement_timeout)}}
+        else:
+            options['connect_args'] = {'options': f'-c statement_timeout={settings.db_statement_timeout}'}
+    return options
+
+
+class Database:
+    """
+    The engines and session factories of a worker. Nothing is created at import: the engines are built
+    on first use (scripts, tests) or by the application lifespan, which also warms the pool before the worker
+    takes traffic and disposes of it on shutdown.
+    """
+
+    def __init__(self, url: str, is_async: bool):
+        self.url = url
+        self.is_async = is_async
+        self._engine = None
+        self._async_engine = None
+        self._session = None
+        self._async_session = None
+
+    @property
+    def engine(self) -> Engine:
+        """
+        The engine function returns the blocking engine, creating it on first use.
+
+        :param self: Represent the instance of the class
+        :return: The engine
+        """
+        if self._engine is None:
+            self._engine = create_engine(self.url, **engine_options(self.url))
+        return self._engine
+
+    @property
+    def async_engine(self) -> AsyncEngine:
+        """
+        The async_engine function returns the asyncio engine, creating it on first use.
+
+        :param self: Represent the instance of the class
+        :return: The engine
+        """
+        if self._async_engine is None:
+            url = to_async_url(self.url)
+            self._async_engine = create_async_engine(url, **engine_options(url, is_async=True))
+        return self._async_engine
+
+    @property
+    def session(self) -> sessionmaker:
+        """
+        The session function returns the factory of blocking sessions.
+
+        :param self: Represent the instance of the class
+        :return: The session factory
+        """
+        if self._session is None:
+            self._session = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
+        return self._session
+
+    @property
+    def async_session(self) -> async_sessionmaker:
+        """
+        The async_session function returns the factory of AsyncSessions.
+
+        :param self: Represent the instance of the class
+        :return: The session factory
+        """
+        if self._async_session is None:
+            self._async_session = async_sessionmaker(self.async_engine, autoflush=False, expire_on_commit=False)
+        return self._async_session
+
+    @property
+    def pool(self):
+        """
+        The pool function returns the connection pool get_db checks sessions out of.
+
+        :param self: Represent the instance of the class
+        :return: The pool
+        """
+        return self.async_engine.sync_engine.pool if self.is_async else self.engine.pool
+
+    async def warm(self, connections: int) -> None:
+        """
+        The warm function opens connections at once and gives them back to the pool,
+        so the first requests of the worker do not pay for connecting.
+
+        :param self: Represent the instance of the class
+        :param connections: int: Number of connections to open
+        :return: None
+        """
+        if self.is_async:
+            opened = await asyncio.gather(*(self.async_engine.connect().start() for _ in range(connections)))
+            await asyncio.gather(*(connection.close() for connection in opened))
+        else:
+            def open_all():
+                opened = [self.engine.connect() for _ in range(connections)]
+                for connection in opened:
+                    connection.close()
+            await asyncio.to_thread(open_all)
+
+    async def dispose(self) -> None:
+        """
+        The dispose function closes the pooled connections of the engines that were created.
+
+        :param self: Represent the instance of the class
+        :return: None
+        """
+        if self._async_engine is not None:
+            await self._async_engine.dispose()
+        if self._engine is not None:
+            self._engine.dispose()
+
+
+database = Database(SQLALCHEMY_DATABASE_URL, settings.database_async)
+
+
+def pool_status() -> dict:
+    """
+    The pool_status function reports the state of the connection pool used by get_db:
+    checked out, idle and overflow connections and the time spent waiting for a checkout.
+
+    :return: A dictionary of pool counters
+    """
+    pool = database.pool
+    status = {'pool': type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        status.update(
+            size=pool.size(),
+            checked_out=pool.checkedout(),
+            idle=pool.checkedin(),
+            overflow=max(pool.overflow(), 0),
+        )
+    if isinstance(pool, _TimedPoolMixin):
+        status.update(
+            checkouts=pool.checkouts,
+            wait_avg_ms=pool.wait_total / pool.checkouts * 1000 if pool.checkouts else 0.0,
+            wait_max_ms=pool.wait_max * 1000,
+        )
+    return status
+
+
+class _SyncResultAdapter:
+    """
+    Wraps a synchronous Result so it can be consumed like an AsyncResult (async for, partitions).
+    """
+
+    def __init__(self, result):
+        self._result = result
+
+    def __getattr__(self, name):
+        return getattr(self._result, name)
+
+    def scalars(self, index=0):
+        return _SyncResultAdapter(self._result.scalars(index))
+
+    def mappings(self):
+        return _SyncResultAdapter(self._result.mappings())
+
+    async def __aiter__(self):
+        for row in self._result:
+            yield row
+
+    async def partitions(self, size=None):
+        for partition in self._result.partitions(size):
+            yield partition
+
+    async def close(self):
+        self._result.close()
+
+
+class SyncSessionAdapter:
+    """
+    Exposes a synchronous Session through the AsyncSession API, so the repository is written once
+    against AsyncSession and still runs with database_async switched off. Every call blocks the event loop,
+    which is what the synchronous mode is kept for: a baseline to benchmark the async engine against.
+    """
+
+    def __init__(self, session: Session):
+        self.sync_session = session
+
+    def __getattr__(self, name):
+        return getattr(self.sync_session, name)
+
+    async def execute(self, statement, params=None, **kwargs):
+        return self.sync_session.execute(statement, params, **kwargs)
+
+    async def scalar(self, statement, params=None, **kwargs):
+        return self.sync_session.scalar(statement, params, **kwargs)
+
+    async def scalars(self, statement, params=None, **kwargs):
+        return self.sync_session.scalars(statement, params, **kwargs)
+
+    async def stream(self, statement, params=None, **kwargs):
+        return _SyncResultAdapter(self.sync_session.execute(statement, params, **kwargs))
+
+    async def stream_scalars(self, statement, params=None, **kwargs):
+        return _SyncResultAdapter(self.sync_session.execute(statement, params, **kwargs)).scalars()
+
+    async def get(self, entity, ident, **kwargs):
+        return self.sync_session.get(entity, ident, **kwargs)
+
+    async def delete(self, instance):
+        self.sync_session.delete(instance)
+
+    async def flush(self, objects=None):
+        self.sync_session.flush(objects)
+
+    async def refresh(self, instance, attribute_names=None):
+        self.sync_session.refresh(instance, attribute_names)
+
+    async def commit(self):
+        self.sync_session.commit()
+
+    async def rollback(self):
+        self.sync_session.rollback()
+
+    async def close(self):
+        self.sync_session.close()
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    async def run_sync(self, fn, *args, **kwargs):
+        return fn(self.sync_session, *args, **kwargs)
 
 
 # Dependency
-def get_db():
+async def get_db():
     """
     The get_db function is a context manager that returns the database session.
     It also ensures that the connection to the database is closed after each request.
+        With settings.database_async the session is an AsyncSession on the asyncpg/aiosqlite engine,
+        otherwise the blocking Session wrapped in SyncSessionAdapter; both are used the same way.
 
     :return: A database session
     """
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+    if database.is_async:
+        async with database.async_session() as db:
+            yield db
+    else:
+        db = database.session()
+        try:
+            yield SyncSessionAdapter(db)
+        finally:
+            db.close()
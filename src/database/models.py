@@ -1,27 +1,60 @@
-from sqlalchemy import Boolean, Column, Integer, String, DateTime, Text, func, ForeignKey
-from sqlalchemy.orm import declarative_base, relationship
+from sqlalchemy import Boolean, Column, Integer, String, DateTime, Text, func, ForeignKey, DDL, Index, event
+from sqlalchemy.orm import declarative_base, relationship, validates
 
 Base = declarative_base()
 
 
+def birthday_key(birthday) -> int:
+    """
+    The birthday_key function turns a birthday into the month * 100 + day number stored in Contact.birthday_md.
+        The key sorts in calendar order and does not depend on the year, so 29 February is just 229.
+
+    :param birthday: date | datetime: The birthday
+    :return: The month/day key of the birthday
+    """
+    return birthday.month * 100 + birthday.day
+
+
+def _birthday_md_default(context):
+    return birthday_key(context.get_current_parameters()['birthday'])
+
+
 class Contact(Base):
     __tablename__ = "contacts"
+    __table_args__ = (
+        Index('ix_contacts_name_trgm', 'name',
+              postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}).ddl_if(dialect='postgresql'),
+        Index('ix_contacts_surname_trgm', 'surname',
+              postgresql_using='gin', postgresql_ops={'surname': 'gin_trgm_ops'}).ddl_if(dialect='postgresql'),
+        Index('ix_contacts_email_trgm', 'email',
+              postgresql_using='gin', postgresql_ops={'email': 'gin_trgm_ops'}).ddl_if(dialect='postgresql'),
+        Index('ix_contacts_phone_trgm', 'phone',
+              postgresql_using='gin', postgresql_ops={'phone': 'gin_trgm_ops'}).ddl_if(dialect='postgresql'),
+        Index('ix_contacts_user_id_birthday_md', 'user_id', 'birthday_md'),
+        Index('ix_contacts_user_id_id', 'user_id', 'id'),
+    )
     id = Column(Integer, primary_key=True)
     name = Column(String(50), nullable=False, )
     surname = Column(String(50), nullable=False)
     email = Column(String(255), unique=True, nullable=False)
     phone = Column(String(20), unique=True, nullable=False)
     birthday = Column(DateTime, nullable=False)
+    birthday_md = Column(Integer, default=_birthday_md_default)
     created_at = Column('created_at', DateTime, default=func.now())
     description = Column(Text, nullable=True)
     user_id = Column('user_id', ForeignKey('users.id', ondelete='CASCADE'), default=None)
     user = relationship('User', backref="contacts")
 
+    @validates('birthday')
+    def validate_birthday(self, key, birthday):
+        self.birthday_md = birthday_key(birthday)
+        return birthday
+
 
 class User(Base):
     __tablename__ = "users"
     id = Column(Integer, primary_key=True)
-    username = Column(String(50))
+    username = Column(String(50), index=True)
     email = Column(String(255), nullable=False, unique=True)
     password = Column(String(255), nullable=False)
     created_at = Column('crated_at', DateTime, default=func.now())
@@ -29,3 +62,6 @@ class User(Base):
     refresh_token = Column(String(255), nullable=True)
     confirmed = Column(Boolean, default=False)
 
+
+event.listen(Base.metadata, 'before_create',
+             DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql'))
@@ -1,26 +1,103 @@
-from datetime import datetime, timedelta
+from datetime import date, datetime, time, timedelta
 
-from sqlalchemy import and_
-from sqlalchemy.orm import Session
+from sqlalchemy import and_, or_, func, case, select, text, insert, update, delete, values, column
+from sqlalchemy import Integer
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import load_only
 
-from src.database.models import Contact, User
-from src.schemas import ContactModel
+from src.database.models import Contact, User, birthday_key
+from src.schemas import ContactModel, ContactOperation
+from src.services import cache
 
+RESPONSE_COLUMNS = (Contact.id, Contact.name, Contact.surname, Contact.email, Contact.phone, Contact.birthday)
 
-async def get_contacts(user: User, db: Session):
+
+def response_columns(fields: tuple | None = None) -> tuple:
     """
-    The get_contacts function returns a list of contacts for the user with the given id.
+    The response_columns function returns the response columns for a sparse fieldset.
+        The id is always included, as it is the pagination cursor.
+
+    :param fields: tuple | None: Names of the ContactResponse fields to select, all of them if None
+    :return: A tuple of columns
+    """
+    if not fields:
+        return RESPONSE_COLUMNS
+    return tuple(column for column in RESPONSE_COLUMNS if column.key == 'id' or column.key in fields)
+
+
+def _select(columns: tuple | None):
+    # Contacts are loaded without description, created_at and user_id, which no response shows
+    return select(*columns) if columns else select(Contact).options(load_only(*RESPONSE_COLUMNS))
+
+
+async def _all(query, db: AsyncSession, columns: tuple | None) -> list:
+    result = await db.execute(query) if columns else await db.scalars(query)
+    return result.all()
 
 
+async def get_contacts(user: User, db: AsyncSession, limit: int | None = None, after: int = 0,
+                       columns: tuple | None = None):
+    """
+    The get_contacts function returns a list of contacts for the user with the given id.
+        Contacts are ordered by id and paged with a keyset cursor: the next page starts after
+        the id of the last contact of the previous one.
+
     :param user: User: Get the user from the database
-    :param db: Session: Access the database
+    :param db: AsyncSession: Access the database
+    :param limit: int | None: Maximum number of contacts to return, all of them if None
+    :param after: int: Return only contacts with an id greater than this one
+    :param columns: tuple | None: Select only these columns and return rows instead of contacts
     :return: A list of contacts for the specified user
     """
-    contacts = db.query(Contact).filter(Contact.user_id == user.id).all()
-    return contacts
+    query = _select(columns).where(and_(Contact.user_id == user.id, Contact.id > after)).order_by(Contact.id)
+    return await _all(query.limit(limit), db, columns)
+
+
+async def stream_contacts(user: User, db: AsyncSession, batch_size: int = 1000, columns: tuple | None = None):
+    """
+    The stream_contacts function yields all contacts of the user one by one, ordered by id.
+        Rows are fetched from a server-side cursor batch_size at a time, so memory use does not grow
+        with the number of contacts.
+
+    :param user: User: Get the user from the database
+    :param db: AsyncSession: Access the database
+    :param batch_size: int: Number of rows fetched from the cursor at once
+    :param columns: tuple | None: Select only these columns and yield rows instead of contacts
+    :return: An async iterator of contacts
+    """
+    query = _select(columns).where(Contact.user_id == user.id).order_by(Contact.id) \
+        .execution_options(yield_per=batch_size)
+    contacts = await db.stream(query) if columns else await db.stream_scalars(query)
+    async for contact in contacts:
+        yield contact
+
+
+EXPORT_COLUMNS = (Contact.id, Contact.name, Contact.surname, Contact.email, Contact.phone, Contact.birthday,
+                  Contact.description)
 
 
-async def get_contact(contact_id: int, user: User, db: Session):
+async def export_contacts(user: User, db: AsyncSession, batch_size: int = 1000):
+    """
+    The export_contacts function yields the EXPORT_COLUMNS of all contacts of the user in batches, ordered by id.
+        Rows come from a server-side cursor batch_size at a time, so memory use does not grow
+        with the number of contacts.
+
+    :param user: User: Get the user from the database
+    :param db: AsyncSession: Access the database
+    :param batch_size: int: Number of rows in a batch
+    :return: An async iterator of lists of rows
+    """
+    result = await db.stream(
+        select(*EXPORT_COLUMNS).where(Contact.user_id == user.id).order_by(Contact.id)
+        .execution_options(yield_per=batch_size)
+    )
+    async for rows in result.partitions():
+        yield rows
+
+
+async def get_contact(contact_id: int, user: User, db: AsyncSession, columns: tuple | None = None):
     """
     The get_contact function takes in a contact_id and user, and returns the contact with that id.
         Args:
@@ -29,30 +106,204 @@ async def get_contact(contact_id: int, user: User, db: Session):
 
     :param contact_id: int: Get the contact with that id from the database
     :param user: User: Check if the user is authorized to access the contact
-    :param db: Session: Pass the database session to the function
+    :param db: AsyncSession: Pass the database session to the function
+    :param columns: tuple | None: Select only these columns and return a row instead of the contact
     :return: A contact object
     """
-    contact = db.query(Contact).filter(and_(Contact.id == contact_id, Contact.user_id == user.id)).first()
+    query = _select(columns).where(and_(Contact.id == contact_id, Contact.user_id == user.id))
+    if columns:
+        return (await db.execute(query)).first()
+    contact = await db.scalar(query)
     return contact
 
 
-async def create_contact(body: ContactModel, user: User, db: Session):
+async def create_contact(body: ContactModel, user: User, db: AsyncSession):
     """
     The create_contact function creates a new contact in the database.
 
     :param body: ContactModel: Specify the type of data that is expected to be passed into the function
     :param user: User: Get the user_id from the user object
-    :param db: Session: Access the database
+    :param db: AsyncSession: Access the database
     :return: The created contact
     """
     contact = Contact(**body.dict(), user_id=user.id)
     db.add(contact)
-    db.commit()
-    db.refresh(contact)
+    await db.commit()
+    await cache.bump_contacts(user.id)
+    await db.refresh(contact)
     return contact
 
 
-async def update_contact(body: ContactModel, contact_id: int, user: User, db: Session):
+def _contact_row(body: ContactModel, user: User) -> dict:
+    return {
+        'name': body.name,
+        'surname': body.surname,
+        'email': body.email,
+        'phone': body.phone,
+        'birthday': datetime.combine(body.birthday, time()),
+        'birthday_md': birthday_key(body.birthday),
+        'user_id': user.id,
+    }
+
+
+IMPORT_COLUMNS = ('name', 'surname', 'email', 'phone', 'birthday', 'birthday_md', 'user_id')
+
+
+async def _copy_contacts(rows: list[dict], db: AsyncSession) -> list[str]:
+    """
+    The _copy_contacts function bulk loads rows on PostgreSQL/asyncpg: COPY into a temporary staging table,
+    then one INSERT ... SELECT ... ON CONFLICT DO NOTHING into contacts.
+
+    :param rows: list[dict]: Contact rows with all IMPORT_COLUMNS
+    :param db: AsyncSession: Access the database
+    :return: Emails of the inserted contacts
+    """
+    await db.execute(text(
+        'CREATE TEMPORARY TABLE IF NOT EXISTS contacts_import ('
+        'name varchar(50), surname varchar(50), email varchar(255), phone varchar(20), '
+        'birthday timestamp, birthday_md integer, user_id integer) ON COMMIT DELETE ROWS'
+    ))
+    connection = await db.connection()
+    raw_connection = await connection.get_raw_connection()
+    await raw_connection.driver_connection.copy_records_to_table(
+        'contacts_import',
+        records=[tuple(row[column] for column in IMPORT_COLUMNS) for row in rows],
+        columns=IMPORT_COLUMNS,
+    )
+    columns = ', '.join(IMPORT_COLUMNS)
+    result = await db.execute(text(
+        f'INSERT INTO contacts ({columns}, created_at) SELECT {columns}, now() FROM contacts_import '
+        f'ON CONFLICT DO NOTHING RETURNING email'
+    ))
+    emails = result.scalars().all()
+    await db.execute(text('TRUNCATE contacts_import'))
+    return emails
+
+
+async def insert_contacts(bodies: list[ContactModel], user: User, db: AsyncSession) -> set[str]:
+    """
+    The insert_contacts function inserts a batch of contacts for the user in one round trip.
+        Contacts whose email or phone already exists are skipped. PostgreSQL on asyncpg loads the batch
+        with COPY, other databases use a batched INSERT ... ON CONFLICT DO NOTHING.
+        The caller commits.
+
+    :param bodies: list[ContactModel]: Validated contacts
+    :param user: User: Owner of the contacts
+    :param db: AsyncSession: Access the database
+    :return: Emails of the inserted contacts
+    """
+    if not bodies:
+        return set()
+    rows = [_contact_row(body, user) for body in bodies]
+    dialect = db.get_bind().dialect
+    if dialect.name == 'postgresql' and dialect.driver == 'asyncpg':
+        return set(await _copy_contacts(rows, db))
+    dialect_insert = postgresql.insert if dialect.name == 'postgresql' else sqlite.insert
+    result = await db.execute(dialect_insert(Contact).on_conflict_do_nothing().returning(Contact.email), rows)
+    return set(result.scalars().all())
+
+
+UPDATE_COLUMNS = ('name', 'surname', 'email', 'phone', 'birthday', 'birthday_md')
+
+
+def _update_statement(contact_id: int, row: dict, user: User):
+    return (
+        update(Contact).where(and_(Contact.id == contact_id, Contact.user_id == user.id))
+        .values({name: row[name] for name in UPDATE_COLUMNS})
+        .returning(*RESPONSE_COLUMNS)
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def _update_many(updates: dict[int, ContactModel], user: User, db: AsyncSession) -> dict:
+    """
+    The _update_many function updates several contacts of the user and returns the new rows by id.
+        PostgreSQL gets a single UPDATE ... FROM (VALUES ...) RETURNING; other databases
+        get one UPDATE ... RETURNING per contact, in the same transaction.
+
+    :param updates: dict[int, ContactModel]: New data by contact id
+    :param user: User: Owner of the contacts
+    :param db: AsyncSession: Access the database
+    :return: A dictionary of updated rows by id
+    """
+    if not updates:
+        return {}
+    rows = {contact_id: _contact_row(body, user) for contact_id, body in updates.items()}
+    if db.get_bind().dialect.name == 'postgresql':
+        data = values(
+            column('id', Integer), *(Contact.__table__.c[name]._copy() for name in UPDATE_COLUMNS), name='data'
+        ).data([(contact_id, *(row[name] for name in UPDATE_COLUMNS)) for contact_id, row in rows.items()])
+        result = await db.execute(
+            update(Contact).where(and_(Contact.id == data.c.id, Contact.user_id == user.id))
+            .values({name: data.c[name] for name in UPDATE_COLUMNS})
+            .returning(*RESPONSE_COLUMNS)
+            .execution_options(synchronize_session=False)
+        )
+        return {row.id: row for row in result}
+    updated = {}
+    for contact_id, row in rows.items():
+        result = await db.execute(_update_statement(contact_id, row, user))
+        row = result.first()
+        if row is not None:
+            updated[row.id] = row
+    return updated
+
+
+async def batch_contacts(operations: list[ContactOperation], user: User, db: AsyncSession) -> list[dict]:
+    """
+    The batch_contacts function applies a list of create, update and delete operations in one transaction.
+        Creates are one batched INSERT ... RETURNING, updates one UPDATE ... FROM VALUES (on PostgreSQL)
+        and deletes one DELETE ... WHERE id IN (...) RETURNING, in that order. Contacts that do not exist
+        or belong to another user are reported as 404 items; a unique email or phone violation raises
+        IntegrityError after the whole batch is rolled back.
+
+    :param operations: list[ContactOperation]: The operations
+    :param user: User: Owner of the contacts
+    :param db: AsyncSession: Access the database
+    :return: A list of results, one per operation, in order
+    """
+    results = [{'index': index, 'op': operation.op} for index, operation in enumerate(operations)]
+    creates = [index for index, operation in enumerate(operations) if operation.op == 'create']
+    updates = {operation.id: operation.contact for operation in operations if operation.op == 'update'}
+    deletes = {operation.id for operation in operations if operation.op == 'delete'}
+    try:
+        if creates:
+            created = await db.execute(
+                insert(Contact).returning(*RESPONSE_COLUMNS, sort_by_parameter_order=True),
+                [_contact_row(operations[index].contact, user) for index in creates]
+            )
+            for index, row in zip(creates, created):
+                results[index].update(status=201, id=row.id, contact=row)
+        updated = await _update_many(updates, user, db)
+        deleted = set()
+        if deletes:
+            result = await db.execute(
+                delete(Contact).where(and_(Contact.id.in_(deletes), Contact.user_id == user.id))
+                .returning(Contact.id)
+                .execution_options(synchronize_session=False)
+            )
+            deleted = set(result.scalars().all())
+        await db.commit()
+        for (cls, (contact_id, *_), *_), instance in list(db.identity_map.items()):
+            if cls is Contact and contact_id in deleted:
+                db.expunge(instance)
+            elif cls is Contact and contact_id in updated:
+                db.expire(instance)
+    except IntegrityError:
+        await db.rollback()
+        raise
+    if creates or updated or deleted:
+        await cache.bump_contacts(user.id)
+    for result, operation in zip(results, operations):
+        if operation.op == 'update':
+            row = updated.get(operation.id)
+            result.update(status=200 if row else 404, id=operation.id, contact=row)
+        elif operation.op == 'delete':
+            result.update(status=204 if operation.id in deleted else 404, id=operation.id)
+    return results
+
+
+async def update_contact(body: ContactModel, contact_id: int, user: User, db: AsyncSession):
     """
     The update_contact function updates a contact in the database.
         Args:
@@ -63,22 +314,18 @@ async def update_contact(body: ContactModel, contact_id: int, user: User, db: Se
     :param body: ContactModel: Pass the contact information to the function
     :param contact_id: int: Identify the contact that is to be deleted
     :param user: User: Get the user from the database
-    :param db: Session: Access the database
-    :return: The updated contact
+    :param db: AsyncSession: Access the database
+    :return: The updated contact row, or None if there is no such contact
     """
-    contact = db.query(Contact).filter(and_(Contact.id == contact_id, Contact.user_id == user.id)).first()
+    result = await db.execute(_update_statement(contact_id, _contact_row(body, user), user))
+    contact = result.first()
+    await db.commit()
     if contact:
-        contact.name = body.name
-        contact.surname = body.surname
-        contact.email = body.email
-        contact.phone = body.phone
-        contact.birthday = body.birthday
-        contact.description = body.description
-        db.commit()
+        await cache.bump_contacts(user.id)
     return contact
 
 
-async def remove_contact(contact_id: int, user: User, db: Session):
+async def remove_contact(contact_id: int, user: User, db: AsyncSession):
     """
     The remove_contact function removes a contact from the database.
         Args:
@@ -88,59 +335,77 @@ async def remove_contact(contact_id: int, user: User, db: Session):
 
     :param contact_id: int: Identify the contact to be removed
     :param user: User: Get the user_id from the database
-    :param db: Session: Pass the database session to the function
-    :return: The contact that was removed
+    :param db: AsyncSession: Pass the database session to the function
+    :return: The id of the removed contact, or None if there is no such contact
     """
-    contact = db.query(Contact).filter(and_(Contact.id == contact_id, Contact.user_id == user.id)).first()
-    if contact:
-        db.delete(contact)
-        db.commit()
-    return contact
+    result = await db.execute(
+        delete(Contact).where(and_(Contact.id == contact_id, Contact.user_id == user.id))
+        .returning(Contact.id)
+        .execution_options(synchronize_session=False)
+    )
+    contact_id = result.scalar()
+    await db.commit()
+    if contact_id:
+        await cache.bump_contacts(user.id)
+    return contact_id
 
 
-async def searcher(field: str, db: Session):
+async def searcher(field: str, user: User, db: AsyncSession, limit: int = 20, offset: int = 0,
+                   columns: tuple | None = None):
     """
-    The searcher function takes a string and a database session as arguments.
-    It then searches the database for contacts that have the string in their name, surname, email or phone number.
-    The function returns a list of all contacts found.
+    The searcher function takes a string, a user and a database session as arguments.
+    It searches the contacts of the user that have the string in their name, surname, email or phone number
+    and returns one page of them.
+        Only the user's contacts are read, through the (user_id, id) index, so the cost of a search
+        follows the size of one account and not of the whole table. On PostgreSQL the matches are ranked
+        by trigram similarity (and the planner may use the pg_trgm GIN indexes for rare strings),
+        elsewhere they are ordered by id.
 
     :param field: str: Specify the field that we want to search for
-    :param db: Session: Connect to the database
+    :param user: User: Owner of the contacts
+    :param db: AsyncSession: Connect to the database
+    :param limit: int: Maximum number of contacts to return
+    :param offset: int: Number of best matches to skip
+    :param columns: tuple | None: Select only these columns and return rows instead of contacts
     :return: A list of contacts that match the search field
     """
-    contact_list = []
-    contacts_all = db.query(Contact).all()
-    for contact in contacts_all:
-        if field.lower() in contact.name.lower() and contact not in contact_list:
-            contact_list.append(contact)
-        if field.lower() in contact.surname.lower() and contact not in contact_list:
-            contact_list.append(contact)
-        if field.lower() in contact.email.lower() and contact not in contact_list:
-            contact_list.append(contact)
-        if field.lower() in contact.phone and contact not in contact_list:
-            contact_list.append(contact)
-
-    return contact_list
-
-
-async def birthday_list(db: Session):
-    """
-    The birthday_list function returns a list of contacts whose birthday is within the next 7 days.
-        The function takes in a database session and queries all contacts from the database.
-        It then iterates through each contact, replacing their birth year with the current year,
-        and subtracting that date from today's date to get a timedelta object. If that timedelta object
-        is between -7 days and 0 days (i.e., if it's less than 0 but greater than -7), then we know their birthday
-        falls within this week.
-
-    :param db: Session: Pass the database session to the function
-    :return: A list of contacts whose birthday is in the next week
-    """
-    contacts_list = []
-    dt_now = datetime.now()
-    now_year = datetime.now().strftime('%Y')
-    contacts = db.query(Contact).all()
-    for contact in contacts:
-        delta = contact.birthday.replace(year=int(now_year)) - dt_now
-        if timedelta(days=-1) < delta < timedelta(days=7):
-            contacts_list.append(contact)
-    return contacts_list
+    pattern = '%' + field.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+    search_columns = (Contact.name, Contact.surname, Contact.email, Contact.phone)
+    query = _select(columns).where(and_(
+        Contact.user_id == user.id,
+        or_(*(column.ilike(pattern, escape='\\') for column in search_columns)),
+    ))
+    if db.get_bind().dialect.name == 'postgresql':
+        score = func.greatest(*(func.similarity(column, field) for column in search_columns))
+        query = query.order_by(score.desc(), Contact.id)
+    else:
+        query = query.order_by(Contact.id)
+    return await _all(query.limit(limit).offset(offset), db, columns)
+
+
+async def birthday_list(user: User, db: AsyncSession, days: int = 7, columns: tuple | None = None):
+    """
+    The birthday_list function returns a list of the user's contacts whose birthday is today or within the next days days.
+        Birthdays are matched by the precomputed Contact.birthday_md (month * 100 + day) column, so the window
+        is a range scan over the (user_id, birthday_md) index: start..end, or start..1231 plus 101..end
+        when it wraps into next year.
+
+    :param user: User: Owner of the contacts
+    :param db: AsyncSession: Pass the database session to the function
+    :param days: int: Number of days after today in the window, so days=7 covers today and the next 7 days
+    :param columns: tuple | None: Select only these columns and return rows instead of contacts
+    :return: A list of contacts whose birthday is in the window, nearest first
+    """
+    today = date.today()
+    start = birthday_key(today)
+    end = birthday_key(today + timedelta(days=days))
+    if days >= 365:
+        condition = Contact.user_id == user.id
+    elif start <= end:
+        condition = and_(Contact.user_id == user.id, Contact.birthday_md.between(start, end))
+    else:
+        condition = and_(Contact.user_id == user.id,
+                         or_(Contact.birthday_md >= start, Contact.birthday_md <= end))
+    query = _select(columns).where(condition) \
+        .order_by(case((Contact.birthday_md >= start, 0), else_=1), Contact.birthday_md, Contact.id)
+    return await _all(query, db, columns)
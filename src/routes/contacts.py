@@ -1,27 +1,98 @@
-from typing import List
+from typing import Awaitable, Callable, List
 
-from fastapi import APIRouter, Depends, HTTPException, status, Path
-from fastapi_limiter.depends import RateLimiter
-from sqlalchemy.orm import Session
+from datetime import date
 
+from fastapi import APIRouter, Depends, HTTPException, status, Path, Query, Request, Response, File, UploadFile
+from fastapi.responses import StreamingResponse
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.config.config import settings
 from src.database.db import get_db
 from src.database.models import User
 from src.repository import contacts as repository_contacts
-from src.schemas import ContactModel, ContactResponse
+from src.schemas import ContactModel, ContactResponse, ContactBatch, ContactOperationResult, ImportReport
+from src.services import cache, exporter, importer, serializer
+from src.services.rate_limit import RateLimit
 from src.services.auth import auth_service
 
 router = APIRouter(prefix='/contacts', tags=['contacts'])
 
+# With the fast JSON path reads select only the response columns and skip ContactResponse validation
+RESPONSE_COLUMNS = repository_contacts.RESPONSE_COLUMNS if settings.fast_json else None
+FIELDS_PATTERN = '^({0})(,({0}))*$'.format('|'.join(serializer.RESPONSE_FIELDS))
+# Per-user limits of the routes, configured by their names in settings.rate_limits
+RATE_LIMITS = {name: RateLimit(name) for name in (
+    'contacts:create', 'contacts:batch', 'contacts:import', 'contacts:list',
+    'contacts:export', 'contacts:read', 'contacts:update', 'contacts:delete',
+)}
+
+
+def sparse_fields(fields: str | None = Query(None, regex=FIELDS_PATTERN,
+                                             description='Comma-separated contact fields to return')):
+    """
+    The sparse_fields function parses the fields query parameter into a sparse fieldset.
+        The id is always part of it.
+
+    :param fields: str | None: Comma-separated ContactResponse field names
+    :return: The field names in ContactResponse order, or None for all fields
+    """
+    if fields is None:
+        return None
+    names = set(fields.split(',')) | {'id'}
+    return tuple(field for field in serializer.RESPONSE_FIELDS if field in names)
+
+
+def projection(fields: tuple | None) -> tuple | None:
+    """
+    The projection function returns the columns a read selects for a sparse fieldset,
+    or None to load contacts as ORM objects.
+
+    :param fields: tuple | None: Sparse fieldset
+    :return: A tuple of columns or None
+    """
+    return repository_contacts.response_columns(fields) if fields else RESPONSE_COLUMNS
+
+
+async def cached_contacts(request: Request, user_id: int, variant: str,
+                          load: Callable[[], Awaitable[tuple[str, dict]]]) -> Response:
+    """
+    The cached_contacts function answers a contacts read from the response cache.
+        The ETag depends only on the contacts generation of the user and the variant, so a request whose
+        If-None-Match holds the current ETag gets 304 without touching the database or the cached body.
+        Otherwise the cached body is sent, or load is called and its result cached under the ETag.
+
+    :param request: Request: The request
+    :param user_id: int: Id of the user whose contacts are read
+    :param variant: str: What else the response depends on
+    :param load: Callable: Coroutine function returning the JSON body and extra headers
+    :return: The response
+    """
+    generation = await cache.contacts_generation(user_id)
+    etag = cache.contacts_etag(user_id, generation, variant)
+    headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+    if_none_match = request.headers.get('if-none-match', '')
+    if etag in (tag.strip().removeprefix('W/') for tag in if_none_match.split(',')):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    cached = await cache.get_response(etag)
+    if cached is None:
+        body, extra = await load()
+        await cache.set_response(etag, body, extra)
+    else:
+        body = cached.pop('body')
+        extra = cached
+    return Response(body, media_type='application/json', headers={**headers, **extra})
+
 
 # Create contact
 @router.post(
     '/create',
     response_model=ContactResponse,
     status_code=status.HTTP_201_CREATED,
-    dependencies=[Depends(RateLimiter(times=5, seconds=60))],
-    description='5 requests per minute limit'
+    dependencies=[Depends(RATE_LIMITS['contacts:create'])],
+    description=RATE_LIMITS['contacts:create'].description
 )
-async def create_contact(body: ContactModel, db: Session = Depends(get_db),
+async def create_contact(body: ContactModel, db: AsyncSession = Depends(get_db),
                          current_user: User = Depends(auth_service.get_current_user)):
     """
     The create_contact function creates a new contact in the database.
@@ -30,7 +101,7 @@ async def create_contact(body: ContactModel, db: Session = Depends(get_db),
             both of which are provided by dependency injection via FastAPI's Depends decorator.
 
     :param body: ContactModel: Get the data from the request body
-    :param db: Session: Get the database session
+    :param db: AsyncSession: Get the database session
     :param current_user: User: Get the user from the database
     :return: The contact that was created
     """
@@ -38,62 +109,230 @@ async def create_contact(body: ContactModel, db: Session = Depends(get_db),
     return contact
 
 
+# Create, update and delete contacts in one transaction
+@router.post(
+    '/batch',
+    response_model=List[ContactOperationResult],
+    dependencies=[Depends(RATE_LIMITS['contacts:batch'])],
+    description=RATE_LIMITS['contacts:batch'].description
+)
+async def batch_contacts(body: ContactBatch, db: AsyncSession = Depends(get_db),
+                         current_user: User = Depends(auth_service.get_current_user)):
+    """
+    The batch_contacts function creates, updates and deletes up to 1000 contacts in one request and one transaction.
+        Each operation gets a result with its own status: 201 created, 200 updated, 204 deleted
+        or 404 if the contact does not exist. If any contact would duplicate an existing email or phone,
+        nothing is applied and the whole batch fails with 409.
+
+    :param body: ContactBatch: The operations
+    :param db: AsyncSession: Get the database session
+    :param current_user: User: Get the current user
+    :return: A list of results, one per operation, in order
+    """
+    try:
+        return await repository_contacts.batch_contacts(body.operations, current_user, db)
+    except IntegrityError:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=importer.DUPLICATE_CONTACT)
+
+
+# Import contacts
+@router.post(
+    '/import',
+    response_model=ImportReport,
+    dependencies=[Depends(RATE_LIMITS['contacts:import'])],
+    description=RATE_LIMITS['contacts:import'].description
+)
+async def import_contacts(file: UploadFile = File(),
+                          fmt: str | None = Query(None, alias='format', regex='^(csv|ndjson)$'),
+                          db: AsyncSession = Depends(get_db),
+                          current_user: User = Depends(auth_service.get_current_user)):
+    """
+    The import_contacts function imports contacts from an uploaded CSV or NDJSON file.
+        CSV files need a header row with the ContactModel field names. The format is taken from the format
+        query parameter, or else from the file extension or content type.
+        Rows that fail validation or duplicate an existing email or phone are skipped and listed in the report.
+
+    :param file: UploadFile: The CSV or NDJSON file
+    :param fmt: str | None: csv or ndjson
+    :param db: AsyncSession: Get the database session
+    :param current_user: User: Get the current user
+    :return: The import report
+    """
+    if fmt is None:
+        filename = (file.filename or '').lower()
+        if filename.endswith('.csv') or 'csv' in (file.content_type or ''):
+            fmt = 'csv'
+        elif filename.endswith(('.ndjson', '.jsonl')) or 'ndjson' in (file.content_type or ''):
+            fmt = 'ndjson'
+        else:
+            raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                                detail='Upload a CSV or NDJSON file')
+    return await importer.import_contacts(file.file, fmt, current_user, db)
+
+
 # Get all contacts
 @router.get(
     '/all',
     response_model=List[ContactResponse],
-    dependencies=[Depends(RateLimiter(times=5, seconds=60))],
-    description='5 requests per minute limit'
+    dependencies=[Depends(RATE_LIMITS['contacts:list'])],
+    description=RATE_LIMITS['contacts:list'].description
 )
-async def get_contacts(db: Session = Depends(get_db),
+async def get_contacts(request: Request, limit: int = Query(100, ge=1, le=1000), after: int = Query(0, ge=0),
+                       stream: bool = Query(False), fields: tuple | None = Depends(sparse_fields),
+                       db: AsyncSession = Depends(get_db),
                        current_user: User = Depends(auth_service.get_current_user)):
     """
-    The get_contacts function returns a list of contacts for the current user.
+    The get_contacts function returns a page of contacts for the current user.
+        Pages are ordered by id; when more contacts may follow, the X-Next-After header holds the value
+        of after for the next page. With stream=true all contacts are sent as NDJSON instead,
+        one contact per line, read from a server-side cursor.
+        Pages are served from the response cache and carry an ETag.
 
-    :param db: Session: Get the database session
+    :param request: Request: Get the If-None-Match header
+    :param limit: int: Maximum number of contacts in the page
+    :param after: int: Return only contacts with an id greater than this one
+    :param stream: bool: Stream all contacts as NDJSON
+    :param fields: tuple | None: Return only these fields (and the id)
+    :param db: AsyncSession: Get the database session
     :param current_user: User: Get the current user
     :return: A list of contacts
     """
-    contacts = await repository_contacts.get_contacts(current_user, db)
-    if contacts is None:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Not Found')
+    if stream:
+        async def ndjson():
+            async for contact in repository_contacts.stream_contacts(current_user, db, columns=projection(fields)):
+                yield serializer.render_lines([contact], fields)
+
+        return StreamingResponse(ndjson(), media_type='application/x-ndjson')
+
+    async def load():
+        contacts = await repository_contacts.get_contacts(current_user, db, limit, after, projection(fields))
+        headers = {'X-Next-After': str(contacts[-1].id)} if len(contacts) == limit else {}
+        return serializer.render_contacts(contacts, fields=fields), headers
+
+    return await cached_contacts(request, current_user.id, f'all:{limit}:{after}:{fields}', load)
+
+
+# Export contacts
+@router.get(
+    '/export',
+    dependencies=[Depends(RATE_LIMITS['contacts:export'])],
+    description=RATE_LIMITS['contacts:export'].description
+)
+async def export_contacts(fmt: str = Query('csv', alias='format', regex='^(csv|ndjson|parquet)$'),
+                          gzip: bool = Query(False), db: AsyncSession = Depends(get_db),
+                          current_user: User = Depends(auth_service.get_current_user)):
+    """
+    The export_contacts function streams all contacts of the current user as a CSV, NDJSON or Parquet file.
+        Rows are read from a server-side cursor and encoded batch by batch, so the worker's memory does not grow
+        with the account size. With gzip=true the stream is sent with Content-Encoding: gzip.
+
+    :param fmt: str: csv, ndjson or parquet
+    :param gzip: bool: Compress the stream
+    :param db: AsyncSession: Get the database session
+    :param current_user: User: Get the current user
+    :return: The streamed file
+    """
+    if fmt == 'parquet' and not exporter.parquet_available():
+        raise HTTPException(status_code=status.HTTP_501_NOT_IMPLEMENTED, detail='Parquet export is not available')
+    chunks = exporter.ENCODERS[fmt](repository_contacts.export_contacts(current_user, db))
+    headers = {'Content-Disposition': f'attachment; filename="contacts.{fmt}"'}
+    if gzip:
+        chunks = exporter.gzip_chunks(chunks)
+        headers['Content-Encoding'] = 'gzip'
+    return StreamingResponse(chunks, media_type=exporter.FORMATS[fmt], headers=headers)
+
+
+# Search contact by fields
+@router.get('/search/{field}', response_model=List[ContactResponse])
+async def searcher(field: str = Path(min_length=2, max_length=20), limit: int = Query(20, ge=1, le=100),
+                   offset: int = Query(0, ge=0), fields: tuple | None = Depends(sparse_fields),
+                   db: AsyncSession = Depends(get_db), current_user: User = Depends(auth_service.get_current_user)):
+    """
+    The searcher function searches for contacts of the current user in the database.
+        It takes a field as an argument and returns one page of the contacts that match the field,
+        best matches first.
+
+    :param field: str: Search for a contact in the database
+    :param max_length: Limit the length of the field
+    :param limit: int: Maximum number of contacts in the page
+    :param offset: int: Number of best matches to skip
+    :param fields: tuple | None: Return only these fields (and the id)
+    :param db: AsyncSession: Get the database session
+    :param current_user: User: Get the current user
+    :return: A list of contacts that match the search criteria
+    """
+    contacts = await repository_contacts.searcher(field, current_user, db, limit, offset, projection(fields))
+    if len(contacts) == 0:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    if settings.fast_json or fields:
+        return Response(serializer.render_contacts(contacts, fields=fields), media_type='application/json')
     return contacts
 
 
+# Bday contacts
+@router.get('/bday', response_model=List[ContactResponse])
+async def birthday_list(request: Request, days: int = Query(7, ge=0, le=365),
+                        fields: tuple | None = Depends(sparse_fields), db: AsyncSession = Depends(get_db),
+                        current_user: User = Depends(auth_service.get_current_user)):
+    """
+    The birthday_list function returns a list of the current user's contacts with birthdays today or in the next days days.
+        The list is served from the response cache and carries an ETag, which also changes with the date.
+
+    :param request: Request: Get the If-None-Match header
+    :param days: int: Number of days after today in the window, so days=7 covers today and the next 7 days
+    :param fields: tuple | None: Return only these fields (and the id)
+    :param db: AsyncSession: Get the database session
+    :param current_user: User: Get the current user
+    :return: A list of contacts with a birthday in the window
+    """
+    async def load():
+        contacts = await repository_contacts.birthday_list(current_user, db, days, projection(fields))
+        return serializer.render_contacts(contacts, fields=fields), {}
+
+    return await cached_contacts(request, current_user.id, f'bday:{days}:{date.today()}:{fields}', load)
+
+
 # Get contact by id
 @router.get(
     '/{contact_id}',
     response_model=ContactResponse,
-    dependencies=[Depends(RateLimiter(times=5, seconds=60))],
-    description='5 requests per minute limit'
+    dependencies=[Depends(RATE_LIMITS['contacts:read'])],
+    description=RATE_LIMITS['contacts:read'].description
 )
-async def get_contact(contact_id: int = Path(1, ge=1), db: Session = Depends(get_db),
+async def get_contact(request: Request, contact_id: int = Path(1, ge=1),
+                      fields: tuple | None = Depends(sparse_fields), db: AsyncSession = Depends(get_db),
                       current_user: User = Depends(auth_service.get_current_user)):
     """
     The get_contact function is a GET request that returns the contact with the given ID.
     The function takes in an optional contact_id parameter, which defaults to 1 if not provided.
     It also takes in a db Session object and current_user User object as parameters, both of which are injected by FastAPI's dependency injection system.
+    The contact is served from the response cache and carries an ETag.
 
+    :param request: Request: Get the If-None-Match header
     :param contact_id: int: Specify the id of the contact to be retrieved
     :param ge: Set a minimum value for the contact_id
-    :param db: Session: Get the database session
+    :param fields: tuple | None: Return only these fields (and the id)
+    :param db: AsyncSession: Get the database session
     :param current_user: User: Get the current user from the auth_service
     :return: A contact object
     """
-    contact = await repository_contacts.get_contact(contact_id, current_user, db)
-    if contact is None:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Not Found')
-    return contact
+    async def load():
+        contact = await repository_contacts.get_contact(contact_id, current_user, db, projection(fields))
+        if contact is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Not Found')
+        return serializer.render_contacts(contact, many=False, fields=fields), {}
+
+    return await cached_contacts(request, current_user.id, f'contact:{contact_id}:{fields}', load)
 
 
 # Update contact
 @router.put(
     '/update/{contact_id}',
     response_model=ContactResponse,
-    dependencies=[Depends(RateLimiter(times=5, seconds=60))],
-    description='5 requests per minute limit'
+    dependencies=[Depends(RATE_LIMITS['contacts:update'])],
+    description=RATE_LIMITS['contacts:update'].description
 )
-async def update_contact(body: ContactModel, contact_id: int = Path(1, ge=1), db: Session = Depends(get_db),
+async def update_contact(body: ContactModel, contact_id: int = Path(1, ge=1), db: AsyncSession = Depends(get_db),
                          current_user: User = Depends(auth_service.get_current_user)):
     """
     The update_contact function updates a contact in the database.
@@ -103,7 +342,7 @@ async def update_contact(body: ContactModel, contact_id: int = Path(1, ge=1), db
     :param body: ContactModel: Get the data from the request body
     :param contact_id: int: Get the contact id from the url
     :param ge: Specify that the contact_id must be greater than or equal to 1
-    :param db: Session: Get the database session
+    :param db: AsyncSession: Get the database session
     :param current_user: User: Get the current user from the auth_service
     :return: The updated contact
     """
@@ -117,10 +356,10 @@ async def update_contact(body: ContactModel, contact_id: int = Path(1, ge=1), db
 @router.delete(
     '/delete/{contact_id}',
     status_code=status.HTTP_204_NO_CONTENT,
-    dependencies=[Depends(RateLimiter(times=5, seconds=60))],
-    description='5 requests per minute limit'
+    dependencies=[Depends(RATE_LIMITS['contacts:delete'])],
+    description=RATE_LIMITS['contacts:delete'].description
 )
-async def remove_contact(contact_id: int = Path(1, ge=1), db: Session = Depends(get_db),
+async def remove_contact(contact_id: int = Path(1, ge=1), db: AsyncSession = Depends(get_db),
                          current_user: User = Depends(auth_service.get_current_user)):
     """
     The remove_contact function removes a contact from the database.
@@ -129,44 +368,11 @@ async def remove_contact(contact_id: int = Path(1, ge=1), db: Session = Depends(
 
     :param contact_id: int: Specify the contact id of the contact to be updated
     :param ge: Specify that the parameter must be greater than or equal to 1
-    :param db: Session: Get the database session
+    :param db: AsyncSession: Get the database session
     :param current_user: User: Get the current user from the database
-    :return: The removed contact
+    :return: The id of the removed contact
     """
     contact = await repository_contacts.remove_contact(contact_id, current_user, db)
     if contact is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
     return contact
-
-
-# Search contact by fields
-@router.get('/search{part_to_search}', response_model=List[ContactResponse])
-async def searcher(field: str = Path(min_length=2, max_length=20), db: Session = Depends(get_db)):
-    """
-    The searcher function searches for contacts in the database.
-        It takes a field as an argument and returns all contacts that match the field.
-
-    :param field: str: Search for a contact in the database
-    :param max_length: Limit the length of the field
-    :param db: Session: Get the database session
-    :return: A list of contacts that match the search criteria
-    """
-    contacts = await repository_contacts.searcher(field, db)
-    if len(contacts) == 0:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
-    return contacts
-
-
-# Bday contacts
-@router.get('/bday', response_model=List[ContactResponse])
-async def birthday_list(db: Session = Depends(get_db)):
-    """
-    The birthday_list function returns a list of contacts with birthdays in the current month.
-
-    :param db: Session: Get the database session
-    :return: A list of contacts with a birthday today
-    """
-    contact = await repository_contacts.birthday_list(db)
-    if contact is None:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
-    return contact
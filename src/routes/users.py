@@ -1,13 +1,11 @@
 from fastapi import APIRouter, Depends, File, UploadFile
-from sqlalchemy.orm import Session
-import cloudinary
-import cloudinary.uploader
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database.db import get_db
 from src.database.models import User
 from src.repository import users as repository_users
+from src.services import avatars
 from src.services.auth import auth_service
-from src.config.config import settings
 from src.schemas import UserDb
 
 router = APIRouter(prefix="/users", tags=["users"])
@@ -29,10 +27,13 @@ async def read_users_me(current_user: User = Depends(auth_service.get_current_us
 async def update_avatar_user(
         file: UploadFile = File(),
         current_user: User = Depends(auth_service.get_current_user),
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_db)
 ):
     """
     The update_avatar_user function updates the avatar of a user.
+        The image is resized to a square and stored by the avatar storage off the event loop;
+        uploading the current avatar again leaves the user unchanged. The previous avatar
+        is deleted only after the new URL is committed.
         Args:
             file (UploadFile): The file to be uploaded.
             current_user (User): The currently logged in user.  This is passed by the Depends decorator,
@@ -40,23 +41,18 @@ async def update_avatar_user(
             with a request header when making an API call to this function's endpoint URL.  If no valid token is found,
             then it will return None and raise HTTPException(status_code=HTTPStatusCode(401),
             detail=&quot;Unauthorized&quot;).
-            db (Session): A database
+            db (AsyncSession): A database
 
-    :param file: UploadFile: Upload the file to cloudinary
+    :param file: UploadFile: Upload the file to the avatar storage
     :param current_user: User: Get the current user
-    :param db: Session: Access the database
+    :param db: AsyncSession: Access the database
     :return: The updated user
     """
-    cloudinary.config(
-        cloud_name=settings.cloudinary_name,
-        api_key=settings.cloudinary_api_key,
-        api_secret=settings.cloudinary_api_secret,
-        secure=True
-    )
-
-    cloudinary.uploader.upload(file.file, public_id=f'ContactsApp/{current_user.username}', overwrite=True)
-    src_url = cloudinary.CloudinaryImage(
-        f'ContactsApp/{current_user.username}').build_url(width=250, height=250, crop='fill'
-                                                          )
+    saved = await avatars.save_avatar(file, current_user)
+    if saved is None:
+        return current_user
+    src_url, previous = saved
     user = await repository_users.update_avatar(current_user.email, src_url, db)
+    if previous is not None:
+        await avatars.delete_avatar(previous)
     return user
@@ -1,6 +1,7 @@
 from datetime import date, datetime
+from typing import Any, List, Literal
 
-from pydantic import BaseModel, Field, EmailStr
+from pydantic import BaseModel, Field, EmailStr, root_validator
 
 
 class ContactModel(BaseModel):
@@ -18,6 +19,45 @@ class ContactResponse(ContactModel):
         orm_mode = True
 
 
+class ContactOperation(BaseModel):
+    op: Literal['create', 'update', 'delete']
+    id: int | None = Field(None, ge=1)
+    contact: ContactModel | None = None
+
+    @root_validator(skip_on_failure=True)
+    def check_operation(cls, values):
+        if values['op'] in ('update', 'delete') and values['id'] is None:
+            raise ValueError(f"id is required to {values['op']} a contact")
+        if values['op'] in ('create', 'update') and values['contact'] is None:
+            raise ValueError(f"contact is required to {values['op']} a contact")
+        return values
+
+
+class ContactBatch(BaseModel):
+    operations: List[ContactOperation] = Field(min_items=1, max_items=1000)
+
+
+class ContactOperationResult(BaseModel):
+    index: int
+    op: str
+    status: int
+    id: int | None = None
+    contact: ContactResponse | None = None
+
+
+class ImportRowError(BaseModel):
+    row: int
+    detail: Any
+
+
+class ImportReport(BaseModel):
+    rows: int
+    inserted: int
+    duplicates: int
+    invalid: int
+    errors: List[ImportRowError]
+
+
 class UserModel(BaseModel):
     username: str = Field(min_length=2, max_length=50)
     email: EmailStr
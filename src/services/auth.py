@@ -1,15 +1,17 @@
-import pickle
+import hashlib
+import time
 
-import redis
 from jose import JWTError, jwt
 from fastapi import HTTPException, status, Depends
 from fastapi.security import OAuth2PasswordBearer
 from passlib.context import CryptContext
 from datetime import datetime, timedelta
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database.db import get_db
 from src.repository import users as repository_users
+from src.services import cache
+from src.services.resources import BoundedExecutor
 from src.config.config import settings
 
 
@@ -18,9 +20,12 @@ class Auth:
     SECRET_KEY = settings.secret_key
     ALGORITHM = settings.algorithm
     oauth2_scheme = OAuth2PasswordBearer(tokenUrl='/api/auth/login')
-    redis_cache = redis.Redis(host=settings.redis_host, port=settings.redis_port, db=0)
+    # bcrypt releases the GIL, so hashing on threads keeps the event loop free; a login burst beyond
+    # password_hash_workers + password_hash_queue jobs is rejected with 503
+    password_executor = BoundedExecutor(settings.password_hash_workers, settings.password_hash_queue,
+                                        'password-hash')
 
-    def verify_password(self, plain_password, hashed_password):
+    async def verify_password(self, plain_password, hashed_password):
         """
         The verify_password function takes a plain-text password and hashed
         password as arguments. It then uses the pwd_context object to verify that the
@@ -31,9 +36,9 @@ class Auth:
         :param hashed_password: Compare the password that is stored in the database with the one that is entered by a user
         :return: A boolean value
         """
-        return self.pwd_context.verify(plain_password, hashed_password)
+        return await self.password_executor.run(self.pwd_context.verify, plain_password, hashed_password)
 
-    def get_password_hash(self, password: str):
+    async def get_password_hash(self, password: str):
         """
         The get_password_hash function takes a password as input and returns the hash of that password.
         The hash is generated using the pwd_context object, which is an instance of Flask-Bcrypt's Bcrypt class.
@@ -42,7 +47,7 @@ class Auth:
         :param password: str: Pass in the password that is being hashed
         :return: A hashed version of the password
         """
-        return self.pwd_context.hash(password)
+        return await self.password_executor.run(self.pwd_context.hash, password)
 
     # define a function to generate a new access token fo 1 hour
     async def create_access_token(self, data: dict, expires_delta: float | None):
@@ -109,7 +114,7 @@ class Auth:
         except JWTError:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Could not validate credentials')
 
-    async def get_current_user(self, token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    async def get_current_user(self, token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
         """
         The get_current_user function is a dependency that will be used in the
             UserRouter class. It takes in a token and db session, and returns the user
@@ -117,7 +122,7 @@ class Auth:
 
         :param self: Refer to the class itself
         :param token: str: Get the token from the request header
-        :param db: Session: Get the database session
+        :param db: AsyncSession: Get the database session
         :return: The user object
         """
         credentials_exception = HTTPException(
@@ -126,10 +131,17 @@ class Auth:
             headers={"WWW-Authenticate": "Bearer"},
         )
 
+        # Decoded claims are kept in process until the token expires, at most l1_cache_ttl seconds
+        token_hash = hashlib.sha256(token.encode()).hexdigest()
+        payload = cache.token_l1.get(token_hash)
         try:
-            # Decode JWT
-            payload = jwt.decode(token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
-            if payload['scope'] == 'access_token':
+            if payload is None:
+                # Decode JWT
+                payload = jwt.decode(token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
+                # A token without exp does not expire, so it is kept for the default l1_cache_ttl
+                exp = payload.get('exp')
+                cache.token_l1.set(token_hash, payload, ttl=None if exp is None else exp - time.time())
+            if payload.get('scope') == 'access_token':
                 email = payload['sub']
                 if email is None:
                     raise credentials_exception
@@ -138,15 +150,12 @@ class Auth:
         except JWTError as e:
             raise credentials_exception
 
-        user = self.redis_cache.get(f"user:{email}")
+        user = await cache.get_user(email)
         if user is None:
             user = await repository_users.get_user_by_email(email, db)
             if user is None:
                 raise credentials_exception
-            self.redis_cache.set(f"user:{email}", pickle.dumps(user))
-            self.redis_cache.expire(f"user:{email}", 900)
-        else:
-            user = pickle.loads(user)
+            await cache.set_user(user)
         return user
 
     def create_email_token(self, data: dict):
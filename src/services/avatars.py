@@ -0,0 +1,244 @@
+import asyncio
+import hashlib
+import io
+import os
+import tempfile
+from pathlib import Path
+
+from fastapi import HTTPException, UploadFile, status
+
+from src.config.config import settings
+from src.database.models import User
+from src.services.messages import IMAGE_TOO_LARGE, INVALID_IMAGE
+from src.services.resources import BoundedExecutor
+
+CHUNK_SIZE = 1024 * 1024
+# Refuse images that would decode to more pixels than this (decompression bombs)
+MAX_PIXELS = 50_000_000
+# Length of the content hash kept in the avatar name
+DIGEST_LENGTH = 16
+
+
+class LocalStorage:
+    """
+    Avatar storage in a directory served by the application itself, for development and tests.
+    """
+
+    def __init__(self, root: str, base_url: str):
+        self.root = Path(root)
+        self.base_url = base_url.rstrip('/')
+
+    def save(self, name: str, data: bytes) -> str:
+        """
+        The save function writes an avatar under root and returns its URL.
+        The file is written next to its final name and renamed, so readers never see half an image.
+
+        :param self: Represent the instance of the class
+        :param name: str: Name of the avatar, like 1/3f2a....jpg
+        :param data: bytes: The image
+        :return: The URL of the avatar
+        """
+        path = self.root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        partial = path.with_suffix('.partial')
+        partial.write_bytes(data)
+        os.replace(partial, path)
+        return f'{self.base_url}/{name}'
+
+    def delete(self, name: str) -> None:
+        """
+        The delete function removes an avatar, if it still exists.
+
+        :param self: Represent the instance of the class
+        :param name: str: Name of the avatar
+        :return: None
+        """
+        (self.root / name).unlink(missing_ok=True)
+
+    def name(self, url: str | None) -> str | None:
+        """
+        The name function returns the name of the avatar stored at url, or None for URLs of other storages.
+
+        :param self: Represent the instance of the class
+        :param url: str | None: URL of an avatar
+        :return: The name of the avatar
+        """
+        prefix = f'{self.base_url}/'
+        return url[len(prefix):] if url and url.startswith(prefix) else None
+
+
+class CloudinaryStorage:
+    """
+    Avatar storage on Cloudinary. Avatars are uploaded already resized, so the URL needs no transformation.
+    The cloudinary SDK is imported on the first upload or delete rather than when the worker starts.
+    """
+
+    def __init__(self, cloud_name: str, api_key: int, api_secret: str, folder: str = 'ContactsApp'):
+        self.credentials = {'cloud_name': cloud_name, 'api_key': api_key, 'api_secret': api_secret}
+        self.folder = folder
+
+    def uploader(self):
+        """
+        The uploader function returns the cloudinary.uploader module, configuring the SDK on first use.
+
+        :param self: Represent the instance of the class
+        :return: The cloudinary.uploader module
+        """
+        import cloudinary
+        import cloudinary.uploader
+        if self.credentials is not None:
+            cloudinary.config(**self.credentials, secure=True)
+            self.credentials = None
+        return cloudinary.uploader
+
+    def save(self, name: str, data: bytes) -> str:
+        """
+        The save function uploads an avatar and returns its URL.
+
+        :param self: Represent the instance of the class
+        :param name: str: Name of the avatar, like 1/3f2a....jpg
+        :param data: bytes: The image
+        :return: The URL of the avatar
+        """
+        result = self.uploader().upload(io.BytesIO(data), public_id=self.public_id(name), overwrite=True)
+        return result['secure_url']
+
+    def delete(self, name: str) -> None:
+        """
+        The delete function removes an uploaded avatar.
+
+        :param self: Represent the instance of the class
+        :param name: str: Name of the avatar
+        :return: None
+        """
+        self.uploader().destroy(self.public_id(name))
+
+    def public_id(self, name: str) -> str:
+        """
+        The public_id function returns the Cloudinary public id of an avatar (without the file extension).
+
+        :param self: Represent the instance of the class
+        :param name: str: Name of the avatar
+        :return: The public id
+        """
+        return f'{self.folder}/{name.rsplit(".", 1)[0]}'
+
+    def name(self, url: str | None) -> str | None:
+        """
+        The name function returns the name of the avatar stored at url, or None for URLs of other storages.
+
+        :param self: Represent the instance of the class
+        :param url: str | None: URL of an avatar
+        :return: The name of the avatar
+        """
+        marker = f'/{self.folder}/'
+        if not url or 'res.cloudinary.com' not in url or marker not in url:
+            return None
+        return url.split(marker, 1)[1]
+
+
+def create_storage():
+    """
+    The create_storage function returns the avatar storage selected by settings.avatar_storage.
+
+    :return: A LocalStorage or CloudinaryStorage
+    """
+    if settings.avatar_storage == 'local':
+        return LocalStorage(settings.avatar_local_dir, settings.avatar_local_url)
+    return CloudinaryStorage(settings.cloudinary_name, settings.cloudinary_api_key, settings.cloudinary_api_secret)
+
+
+storage = create_storage()
+# Pillow releases the GIL while decoding and resizing, so the work runs on threads next to the event loop;
+# uploads beyond avatar_workers + avatar_queue jobs are rejected with 503
+avatar_executor = BoundedExecutor(settings.avatar_workers, settings.avatar_queue, 'avatar')
+
+
+def spool(source, max_bytes: int) -> tuple[str, str]:
+    """
+    The spool function copies an upload to a temporary file in chunks, hashing it on the way.
+
+    :param source: A binary file object
+    :param max_bytes: int: Largest accepted upload
+    :return: The path of the temporary file and the hex SHA-256 of the upload
+    """
+    digest = hashlib.sha256()
+    size = 0
+    with tempfile.NamedTemporaryFile(prefix='avatar-', delete=False) as target:
+        try:
+            while chunk := source.read(CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=IMAGE_TOO_LARGE)
+                digest.update(chunk)
+                target.write(chunk)
+        except BaseException:
+            os.unlink(target.name)
+            raise
+    return target.name, digest.hexdigest()
+
+
+def normalize(path: str, size: int) -> bytes:
+    """
+    The normalize function turns an uploaded image into a size x size JPEG: rotated by its EXIF orientation,
+    cropped to a centered square and flattened onto white if it has transparency.
+
+    :param path: str: Path of the uploaded image
+    :param size: int: Width and height of the avatar
+    :return: The JPEG image
+    """
+    # Pillow is only needed once the first avatar is uploaded
+    from PIL import Image, ImageOps
+    try:
+        with Image.open(path) as image:
+            if image.width * image.height > MAX_PIXELS:
+                raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=IMAGE_TOO_LARGE)
+            # JPEG can decode straight at a reduced scale, which is much cheaper than a full decode
+            image.draft('RGB', (size * 2, size * 2))
+            image = ImageOps.exif_transpose(image)
+            if image.mode in ('RGBA', 'LA', 'P'):
+                image = image.convert('RGBA')
+                background = Image.new('RGBA', image.size, 'white')
+                image = Image.alpha_composite(background, image)
+            image = ImageOps.fit(image.convert('RGB'), (size, size), Image.Resampling.LANCZOS)
+            output = io.BytesIO()
+            image.save(output, 'JPEG', quality=85, optimize=True)
+            return output.getvalue()
+    except (OSError, SyntaxError, ValueError, Image.DecompressionBombError):
+        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail=INVALID_IMAGE)
+
+
+async def save_avatar(file: UploadFile, user: User) -> tuple[str, str | None] | None:
+    """
+    The save_avatar function stores a new avatar of the user without blocking the event loop.
+        The upload is spooled to a temporary file and hashed, resized on the avatar executor and handed
+        to the storage on a thread. The avatar is named after the hash of the upload, so uploading
+        the current avatar again does no work at all. The previous avatar is left in place: the caller
+        deletes it with delete_avatar once the new URL is committed, so the user never points at a deleted file.
+
+    :param file: UploadFile: The uploaded image
+    :param user: User: Owner of the avatar
+    :return: The URL of the new avatar and the name of the previous one (None if it is not in the storage),
+        or None if the user already has this avatar
+    """
+    path, digest = await avatar_executor.run(spool, file.file, settings.avatar_max_bytes)
+    try:
+        name = f'{user.id}/{digest[:DIGEST_LENGTH]}.jpg'
+        previous = storage.name(user.avatar)
+        if previous == name:
+            return None
+        data = await avatar_executor.run(normalize, path, settings.avatar_size)
+    finally:
+        os.unlink(path)
+    url = await asyncio.to_thread(storage.save, name, data)
+    return url, previous
+
+
+async def delete_avatar(name: str) -> None:
+    """
+    The delete_avatar function removes an avatar from the storage on a thread.
+
+    :param name: str: Name of the avatar, as returned by save_avatar
+    :return: None
+    """
+    await asyncio.to_thread(storage.delete, name)
@@ -0,0 +1,278 @@
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+import redis.asyncio as redis
+
+from src.config.config import settings
+from src.database.models import User
+from src.services.resources import resources
+
+# Bump when the snapshot layout changes, so entries written by older code are never read back
+USER_CACHE_VERSION = 2
+USER_SNAPSHOT_FIELDS = ('id', 'username', 'email', 'avatar', 'confirmed')
+USER_INVALIDATION_CHANNEL = 'user:invalidate'
+CONTACTS_CACHE_VERSION = 1
+
+
+class LocalCache:
+    """
+    Bounded in-process LRU cache whose entries also expire after a TTL. A size of 0 disables it.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+
+    def get(self, key):
+        """
+        The get method returns the cached value of the key, or None if it is missing or expired.
+
+        :param self: Represent the instance of the class
+        :param key: Cache key
+        :return: The cached value or None
+        """
+        item = self._data.get(key)
+        if item is not None:
+            value, expires = item
+            if expires > time.monotonic():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._data[key]
+        self.misses += 1
+        return None
+
+    def set(self, key, value, ttl: float | None = None):
+        """
+        The set method caches the value, evicting the least recently used entries above maxsize.
+
+        :param self: Represent the instance of the class
+        :param key: Cache key
+        :param value: Value to cache
+        :param ttl: float | None: Lifetime in seconds, capped by the cache TTL
+        :return: None
+        """
+        if self.maxsize <= 0:
+            return
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        self._data[key] = (value, time.monotonic() + ttl)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def stats(self) -> dict:
+        return {'size': len(self._data), 'hits': self.hits, 'misses': self.misses}
+
+
+L1_CACHE_SIZE = settings.l1_cache_size if settings.l1_cache_enabled else 0
+
+# Decoded access token claims by token hash, and user snapshots by email
+token_l1 = LocalCache(L1_CACHE_SIZE, settings.l1_cache_ttl)
+user_l1 = LocalCache(L1_CACHE_SIZE, settings.l1_cache_ttl)
+
+
+def user_key(email: str) -> str:
+    """
+    The user_key function returns the Redis key of the cached user with the given email.
+
+    :param email: str: Email of the user
+    :return: The Redis key
+    """
+    return f"user:v{USER_CACHE_VERSION}:{email}"
+
+
+def dump_user(user: User) -> str:
+    """
+    The dump_user function serializes the columns of a user needed by authenticated requests into a JSON snapshot.
+        The password hash and refresh token are not part of the snapshot.
+
+    :param user: User: The user to serialize
+    :return: The JSON snapshot
+    """
+    data = {field: getattr(user, field) for field in USER_SNAPSHOT_FIELDS}
+    data['created_at'] = user.created_at.isoformat() if user.created_at else None
+    return json.dumps(data, separators=(',', ':'))
+
+
+def load_user(snapshot: str) -> User:
+    """
+    The load_user function builds a detached User from a JSON snapshot written by dump_user.
+
+    :param snapshot: str: The JSON snapshot
+    :return: The user
+    """
+    data = json.loads(snapshot)
+    if data['created_at'] is not None:
+        data['created_at'] = datetime.fromisoformat(data['created_at'])
+    return User(**data)
+
+
+async def get_user(email: str) -> User | None:
+    """
+    The get_user function returns the cached user with the given email, or None on a cache miss.
+        The in-process cache is looked up first, then Redis, whose answer is kept in the in-process cache.
+
+    :param email: str: Email of the user
+    :return: The user or None
+    """
+    snapshot = user_l1.get(email)
+    if snapshot is None:
+        snapshot = await resources.redis.get(user_key(email))
+        if snapshot is None:
+            return None
+        user_l1.set(email, snapshot)
+    return load_user(snapshot)
+
+
+async def set_user(user: User) -> None:
+    """
+    The set_user function caches a snapshot of the user for settings.user_cache_ttl seconds
+    with a single SET ... EX command.
+
+    :param user: User: The user to cache
+    :return: None
+    """
+    snapshot = dump_user(user)
+    await resources.redis.set(user_key(user.email), snapshot, ex=settings.user_cache_ttl)
+    user_l1.set(user.email, snapshot)
+
+
+async def invalidate_user(email: str) -> None:
+    """
+    The invalidate_user function drops the cached user with the given email, so the next request reloads it.
+        Other workers are told to drop their in-process copy through Redis pub/sub.
+
+    :param email: str: Email of the user
+    :return: None
+    """
+    user_l1.pop(email)
+    await resources.redis.delete(user_key(email))
+    await resources.redis.publish(USER_INVALIDATION_CHANNEL, email)
+
+
+async def listen_invalidations(retry_delay: float = 1.0) -> None:
+    """
+    The listen_invalidations function runs for the lifetime of the worker and drops users invalidated
+    by any worker from the in-process cache. While the subscription is down, entries live at most
+    settings.l1_cache_ttl seconds, and the in-process cache is cleared on reconnect.
+
+    :param retry_delay: float: Seconds to wait before resubscribing after a Redis error
+    :return: None
+    """
+    while True:
+        pubsub = resources.redis.pubsub()
+        try:
+            await pubsub.subscribe(USER_INVALIDATION_CHANNEL)
+            user_l1.clear()
+            async for message in pubsub.listen():
+                if message['type'] == 'message':
+                    user_l1.pop(message['data'])
+        except redis.RedisError:
+            await asyncio.sleep(retry_delay)
+        finally:
+            await pubsub.reset()
+
+
+def generation_key(user_id: int) -> str:
+    """
+    The generation_key function returns the Redis key of the contacts generation counter of a user.
+
+    :param user_id: int: Id of the user
+    :return: The Redis key
+    """
+    return f"contacts:gen:{user_id}"
+
+
+async def contacts_generation(user_id: int) -> int:
+    """
+    The contacts_generation function returns the current contacts generation of a user.
+        The counter starts at 0 and only grows, so a cached response is valid as long as the generation
+        it was stored under is the current one.
+
+    :param user_id: int: Id of the user
+    :return: The generation
+    """
+    return int(await resources.redis.get(generation_key(user_id)) or 0)
+
+
+async def bump_contacts(user_id: int) -> None:
+    """
+    The bump_contacts function starts a new contacts generation for the user, which makes every cached
+    contacts response of the user stale at once. Call it after the change is committed.
+
+    :param user_id: int: Id of the user whose contacts changed
+    :return: None
+    """
+    await resources.redis.incr(generation_key(user_id))
+
+
+def contacts_etag(user_id: int, generation: int, variant: str) -> str:
+    """
+    The contacts_etag function returns the ETag of a contacts response: the generation
+    and a digest of the variant (path and query string of the request).
+
+    :param user_id: int: Id of the user
+    :param generation: int: Contacts generation the response belongs to
+    :param variant: str: What else the response depends on
+    :return: The quoted ETag
+    """
+    digest = hashlib.sha1(f"{user_id}:{variant}".encode()).hexdigest()[:16]
+    return f'"{CONTACTS_CACHE_VERSION}.{generation}.{digest}"'
+
+
+def response_key(etag: str) -> str:
+    """
+    The response_key function returns the Redis key of the cached response with the given ETag.
+
+    :param etag: str: ETag from contacts_etag
+    :return: The Redis key
+    """
+    return "contacts:response:" + etag.strip('"')
+
+
+async def get_response(etag: str) -> dict | None:
+    """
+    The get_response function returns the cached serialized body and headers of a contacts response,
+    or None on a cache miss.
+
+    :param etag: str: ETag of the response
+    :return: A dictionary with the body under 'body' and the headers, or None
+    """
+    return await resources.redis.hgetall(response_key(etag)) or None
+
+
+async def set_response(etag: str, body: str, headers: dict) -> None:
+    """
+    The set_response function caches the serialized body and headers of a contacts response
+    for settings.contacts_cache_ttl seconds.
+
+    :param etag: str: ETag of the response
+    :param body: str: JSON body
+    :param headers: dict: Headers to send with the body
+    :return: None
+    """
+    key = response_key(etag)
+    async with resources.redis.pipeline(transaction=True) as pipe:
+        await pipe.hset(key, mapping={'body': body, **headers}).expire(key, settings.contacts_cache_ttl).execute()
+
+
+def cache_stats() -> dict:
+    """
+    The cache_stats function returns the size and hit/miss counters of the in-process caches.
+
+    :return: A dictionary of counters
+    """
+    return {'tokens': token_l1.stats(), 'users': user_l1.stats()}
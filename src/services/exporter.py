@@ -0,0 +1,134 @@
+import csv
+import io
+import json
+import zlib
+from typing import AsyncIterator
+
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+    'parquet': 'application/vnd.apache.parquet',
+}
+EXPORT_FIELDS = ('id', 'name', 'surname', 'email', 'phone', 'birthday', 'description')
+
+
+class _ChunkSink(io.RawIOBase):
+    """
+    Write-only file that keeps what was written since the last drain, for streaming a Parquet file.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+async def encode_csv(batches: AsyncIterator[list]) -> AsyncIterator[bytes]:
+    """
+    The encode_csv function encodes batches of export rows as CSV with a header row, one chunk per batch.
+
+    :param batches: AsyncIterator[list]: Batches of rows from repository.contacts.export_contacts
+    :return: An async iterator of CSV chunks
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_FIELDS)
+    async for rows in batches:
+        writer.writerows((*row[:5], row[5].date().isoformat(), row[6]) for row in rows)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+async def encode_ndjson(batches: AsyncIterator[list]) -> AsyncIterator[bytes]:
+    """
+    The encode_ndjson function encodes batches of export rows as NDJSON, one JSON object per line.
+
+    :param batches: AsyncIterator[list]: Batches of rows from repository.contacts.export_contacts
+    :return: An async iterator of NDJSON chunks
+    """
+    async for rows in batches:
+        yield ''.join(
+            json.dumps(dict(zip(EXPORT_FIELDS, (*row[:5], row[5].date().isoformat(), row[6])))) + '\n'
+            for row in rows
+        ).encode()
+
+
+async def encode_parquet(batches: AsyncIterator[list]) -> AsyncIterator[bytes]:
+    """
+    The encode_parquet function encodes batches of export rows as a Parquet file, one row group per batch.
+        Needs the optional pyarrow dependency.
+
+    :param batches: AsyncIterator[list]: Batches of rows from repository.contacts.export_contacts
+    :return: An async iterator of Parquet file chunks
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ('id', pa.int64()), ('name', pa.string()), ('surname', pa.string()), ('email', pa.string()),
+        ('phone', pa.string()), ('birthday', pa.date32()), ('description', pa.string()),
+    ])
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema)
+    async for rows in batches:
+        columns = list(zip(*rows))
+        columns[5] = [birthday.date() for birthday in columns[5]]
+        writer.write_table(pa.Table.from_arrays([pa.array(column, type=field.type)
+                                                 for column, field in zip(columns, schema)], schema=schema))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+async def gzip_chunks(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """
+    The gzip_chunks function gzip-compresses a stream of chunks on the fly.
+
+    :param chunks: AsyncIterator[bytes]: Chunks to compress
+    :return: An async iterator of gzip chunks
+    """
+    compressor = zlib.compressobj(wbits=31)
+    async for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+ENCODERS = {
+    'csv': encode_csv,
+    'ndjson': encode_ndjson,
+    'parquet': encode_parquet,
+}
+
+
+def parquet_available() -> bool:
+    """
+    The parquet_available function tells whether the optional pyarrow dependency is installed.
+
+    :return: True if Parquet export is possible
+    """
+    try:
+        import pyarrow.parquet
+    except ImportError:
+        return False
+    return True
@@ -0,0 +1,145 @@
+import codecs
+import csv
+import json
+from itertools import islice
+from typing import BinaryIO, Iterator
+
+from fastapi import HTTPException, status
+from fastapi.concurrency import run_in_threadpool
+from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.config.config import settings
+from src.database.models import User
+from src.repository import contacts as repository_contacts
+from src.schemas import ContactModel
+from src.services import cache
+
+FORMATS = ('csv', 'ndjson')
+DUPLICATE_CONTACT = 'Contact with this email or phone already exists'
+NOT_UTF8 = 'The file is not UTF-8 text'
+DECODE_BLOCK_SIZE = 1024 * 1024
+
+
+def is_utf8(file: BinaryIO) -> bool:
+    """
+    The is_utf8 function checks that the whole uploaded file decodes as UTF-8, block by block,
+    and rewinds it. The import commits chunk by chunk, so a file is checked before its first row is inserted.
+
+    :param file: BinaryIO: The uploaded file
+    :return: True if the file is UTF-8
+    """
+    decoder = codecs.getincrementaldecoder('utf-8-sig')()
+    try:
+        for block in iter(lambda: file.read(DECODE_BLOCK_SIZE), b''):
+            decoder.decode(block)
+        decoder.decode(b'', final=True)
+    except UnicodeDecodeError:
+        return False
+    finally:
+        file.seek(0)
+    return True
+
+
+def read_rows(file: BinaryIO, fmt: str) -> Iterator[tuple[int, dict | None, str | None]]:
+    """
+    The read_rows function parses an uploaded CSV (with a header row) or NDJSON file lazily, row by row.
+
+    :param file: BinaryIO: The uploaded file
+    :param fmt: str: csv or ndjson
+    :return: An iterator of (row number, row, parse error) tuples
+    """
+    lines = codecs.getreader('utf-8-sig')(file)
+    if fmt == 'csv':
+        reader = csv.DictReader(lines)
+        number = 0
+        while True:
+            number += 1
+            try:
+                row = next(reader)
+            except StopIteration:
+                return
+            except csv.Error as err:
+                yield number, None, str(err)
+                continue
+            # DictReader puts the values past the header under the None key
+            if None in row:
+                yield number, None, f'Expected {len(reader.fieldnames)} fields, got {len(row) - 1 + len(row[None])}'
+            else:
+                yield number, row, None
+    for number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as err:
+            yield number, None, str(err)
+            continue
+        if isinstance(row, dict):
+            yield number, row, None
+        else:
+            yield number, None, 'Expected a JSON object'
+
+
+def validate_chunk(rows: Iterator, size: int) -> tuple[int, list[tuple[int, ContactModel]], list[dict]]:
+    """
+    The validate_chunk function takes the next size rows and validates them with ContactModel.
+
+    :param rows: Iterator: Rows from read_rows
+    :param size: int: Number of rows to take
+    :return: The number of rows taken, the valid contacts with their row numbers and the row errors
+    """
+    taken = 0
+    contacts = []
+    errors = []
+    for number, row, error in islice(rows, size):
+        taken += 1
+        if error is not None:
+            errors.append({'row': number, 'detail': error})
+            continue
+        try:
+            contacts.append((number, ContactModel(**row)))
+        except ValidationError as err:
+            errors.append({'row': number, 'detail': err.errors()})
+    return taken, contacts, errors
+
+
+async def import_contacts(file: BinaryIO, fmt: str, user: User, db: AsyncSession) -> dict:
+    """
+    The import_contacts function imports contacts from an uploaded CSV or NDJSON file for the user.
+        The file is read, validated and inserted settings.import_chunk_size rows at a time, and every chunk
+        is committed on its own, so memory stays bounded whatever the file size. Parsing and validation run
+        in the threadpool to keep the event loop free. The report lists at most settings.import_max_errors errors.
+        A file that is not UTF-8 is rejected with 400 before anything is inserted.
+
+    :param file: BinaryIO: The uploaded file
+    :param fmt: str: csv or ndjson
+    :param user: User: Owner of the imported contacts
+    :param db: AsyncSession: Access the database
+    :return: The import report
+    """
+    if not await run_in_threadpool(is_utf8, file):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=NOT_UTF8)
+    report = {'rows': 0, 'inserted': 0, 'duplicates': 0, 'invalid': 0, 'errors': []}
+    rows = read_rows(file, fmt)
+    while True:
+        taken, contacts, errors = await run_in_threadpool(validate_chunk, rows, settings.import_chunk_size)
+        if not taken:
+            break
+        inserted = await repository_contacts.insert_contacts([body for _, body in contacts], user, db)
+        await db.commit()
+        if inserted:
+            await cache.bump_contacts(user.id)
+        seen = set()
+        for number, body in contacts:
+            if body.email in inserted and body.email not in seen:
+                seen.add(body.email)
+                report['inserted'] += 1
+            else:
+                report['duplicates'] += 1
+                errors.append({'row': number, 'detail': DUPLICATE_CONTACT})
+        report['rows'] += taken
+        report['invalid'] += taken - len(contacts)
+        free = settings.import_max_errors - len(report['errors'])
+        report['errors'].extend(sorted(errors, key=lambda error: error['row'])[:free])
+    return report
@@ -3,3 +3,7 @@ EMAIL_NOT_CONFIRMED = 'Email not confirmed'
 INVALID_PASSWORD = 'Invalid password'
 INVALID_EMAIL = 'Invalid email'
 NOT_FOUND = 'Not found'
+SERVICE_BUSY = 'Server is busy, try again later'
+INVALID_IMAGE = 'The file is not a supported image'
+IMAGE_TOO_LARGE = 'The image is too large'
+TOO_MANY_REQUESTS = 'Too many requests'
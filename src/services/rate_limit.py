@@ -0,0 +1,199 @@
+import asyncio
+import time
+
+import redis.asyncio as redis
+from fastapi import Depends, HTTPException, status
+
+from src.config.config import settings
+from src.database.models import User
+from src.services.auth import auth_service
+from src.services.messages import TOO_MANY_REQUESTS
+from src.services.resources import resources
+
+RATE_LIMIT_PREFIX = 'rl'
+
+
+def parse_limit(limit: str) -> tuple[int, int]:
+    """
+    The parse_limit function reads a limit written as times/seconds, like 5/60.
+
+    :param limit: str: The limit
+    :return: The number of requests and the length of the window in seconds
+    """
+    times, seconds = limit.split('/')
+    return int(times), int(seconds)
+
+
+def route_limit(name: str) -> tuple[int, int]:
+    """
+    The route_limit function returns the limit of a route from settings.rate_limits,
+    or settings.rate_limit_default for routes it does not list.
+
+    :param name: str: Name of the route, like contacts:create
+    :return: The number of requests and the length of the window in seconds
+    """
+    return parse_limit(settings.rate_limits.get(name, settings.rate_limit_default))
+
+
+class SlidingWindowLimiter:
+    """
+    Approximate sliding-window rate limiter, shared by the workers through Redis counters.
+
+    Every key counts hits in fixed windows of its length, and a hit is allowed while
+    previous window * (1 - elapsed part of the current window) + current window stays under the limit.
+    Hits are decided on the counts this worker knows and recorded locally; sync sends the pending hits
+    of all keys in one pipeline (INCRBY + EXPIRE per window) and gets back the totals of all workers.
+    A request therefore costs no Redis round trip; a worker costs one round trip per sync_interval.
+
+    Tolerance: a worker learns the hits of the other workers only when it syncs the key, so in steady
+    traffic a key can go over its limit by the hits the other workers admitted within one sync_interval.
+    Each worker on its own never admits more than the limit, so the overshoot is at most
+    (workers - 1) * times per window. With a single worker the limit is exact.
+
+    Without a redis_client the limiter uses the Redis client of the worker's resources.
+    """
+
+    def __init__(self, redis_client: redis.Redis | None = None, sync_interval: float = 0.5, prefix: str = RATE_LIMIT_PREFIX):
+        self.redis_client = redis_client
+        self.sync_interval = sync_interval
+        self.prefix = prefix
+        # key -> [seconds, {window: known total}, {window: hits not sent yet}]
+        self.keys = {}
+        self.counters = {'allowed': 0, 'rejected': 0, 'syncs': 0, 'redis_ops': 0, 'sync_errors': 0}
+
+    def hit(self, key: str, times: int, seconds: int, now: float | None = None) -> int:
+        """
+        The hit function counts a request against the limit of key, if the limit allows it.
+
+        :param self: Represent the instance of the class
+        :param key: str: What is limited, like contacts:create:42
+        :param times: int: Number of requests allowed per window
+        :param seconds: int: Length of the window
+        :param now: float | None: Current time, for tests
+        :return: 0 if the request is allowed, otherwise the seconds to wait before retrying
+        """
+        now = time.time() if now is None else now
+        window, elapsed = divmod(now, seconds)
+        window = int(window)
+        state = self.keys.setdefault(key, [seconds, {}, {}])
+        totals, pending = state[1], state[2]
+        estimate = totals.get(window - 1, 0) * (1 - elapsed / seconds) + totals.get(window, 0)
+        if estimate >= times:
+            self.counters['rejected'] += 1
+            return int(seconds - elapsed) + 1
+        totals[window] = totals.get(window, 0) + 1
+        pending[window] = pending.get(window, 0) + 1
+        self.counters['allowed'] += 1
+        return 0
+
+    async def sync(self, now: float | None = None) -> None:
+        """
+        The sync function sends the pending hits of every key to Redis in one pipeline
+        and replaces the known totals with the totals of all workers. Keys idle for two windows are dropped.
+
+        :param self: Represent the instance of the class
+        :param now: float | None: Current time, for tests
+        :return: None
+        """
+        now = time.time() if now is None else now
+        synced = []
+        redis_client = self.redis_client or resources.redis
+        async with redis_client.pipeline(transaction=False) as pipe:
+            for key, (seconds, totals, pending) in list(self.keys.items()):
+                window = int(now // seconds)
+                if not pending and max(totals, default=window) < window - 1:
+                    del self.keys[key]
+                    continue
+                if not pending:
+                    continue
+                windows = sorted(set(pending) | {window - 1, window})
+                for number in windows:
+                    redis_key = f'{self.prefix}:{key}:{number}'
+                    pipe.incrby(redis_key, pending.get(number, 0))
+                    pipe.expire(redis_key, 2 * seconds)
+                synced.append((key, windows, dict(pending)))
+                pending.clear()
+            if not synced:
+                return
+            try:
+                results = await pipe.execute()
+            except redis.RedisError:
+                # Put the hits back, they are sent with the next sync
+                for key, windows, sent in synced:
+                    for number, hits in sent.items():
+                        self.keys[key][2][number] = self.keys[key][2].get(number, 0) + hits
+                self.counters['sync_errors'] += 1
+                raise
+        self.counters['syncs'] += 1
+        self.counters['redis_ops'] += len(results)
+        results = iter(results[::2])
+        for key, windows, _ in synced:
+            seconds, totals, pending = self.keys[key]
+            for number in windows:
+                # Hits admitted while the pipeline ran are not in the Redis total yet
+                totals[number] = int(next(results)) + pending.get(number, 0)
+            for number in [number for number in totals if number < windows[-1] - 1]:
+                del totals[number]
+
+    async def run(self) -> None:
+        """
+        The run function syncs the limiter every sync_interval seconds for the lifetime of the worker.
+        While Redis is down the limits are enforced per worker.
+
+        :param self: Represent the instance of the class
+        :return: None
+        """
+        while True:
+            await asyncio.sleep(self.sync_interval)
+            try:
+                await self.sync()
+            except redis.RedisError:
+                pass
+
+    def stats(self) -> dict:
+        """
+        The stats function returns the number of tracked keys and the counters of allowed and rejected
+        requests and of the Redis syncs.
+
+        :param self: Represent the instance of the class
+        :return: A dictionary of counters
+        """
+        return {'keys': len(self.keys), **self.counters}
+
+
+limiter = SlidingWindowLimiter(sync_interval=settings.rate_limit_sync_interval)
+
+
+class RateLimit:
+    """
+    Dependency that limits a route per authenticated user, with the limit settings give the route's name.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+
+    @property
+    def description(self) -> str:
+        """
+        The description function describes the limit for the OpenAPI documentation of the route.
+
+        :param self: Represent the instance of the class
+        :return: The description
+        """
+        times, seconds = route_limit(self.name)
+        return f'{times} requests per minute limit' if seconds == 60 else f'{times} requests per {seconds} seconds limit'
+
+    async def __call__(self, current_user: User = Depends(auth_service.get_current_user)) -> None:
+        """
+        The __call__ function rejects the request with 429 when the user is over the limit of the route.
+        FastAPI resolves get_current_user once per request, so the route gets the same user without extra work.
+
+        :param self: Represent the instance of the class
+        :param current_user: User: The user the limit applies to
+        :return: None
+        """
+        times, seconds = route_limit(self.name)
+        retry_after = limiter.hit(f'{self.name}:{current_user.id}', times, seconds)
+        if retry_after:
+            raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=TOO_MANY_REQUESTS,
+                                headers={'Retry-After': str(retry_after)})
@@ -0,0 +1,136 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING
+
+from fastapi import HTTPException, status
+from redis import asyncio as aioredis
+
+from src.config.config import settings
+from src.database.db import Database, database
+from src.services.messages import SERVICE_BUSY
+
+if TYPE_CHECKING:
+    from src.services.send_email import MailQueue
+
+logger = logging.getLogger(__name__)
+
+
+class BoundedExecutor:
+    """
+    Thread pool for blocking calls that release the GIL (bcrypt, Pillow), so they run next to the event loop.
+    At most workers jobs run and queue more wait; beyond that the request is rejected with 503 and Retry-After,
+    so a burst cannot pile up unbounded work.
+    """
+
+    def __init__(self, workers: int, queue: int, name: str):
+        self.limit = workers + queue
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+        self.jobs = 0
+
+    async def run(self, fn, *args):
+        """
+        The run function runs a blocking function on the pool without blocking the event loop.
+
+        :param self: Represent the instance of the class
+        :param fn: The function to run
+        :param args: Arguments of the function
+        :return: The result of the function
+        """
+        if self.jobs >= self.limit:
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=SERVICE_BUSY,
+                                headers={'Retry-After': '1'})
+        self.jobs += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+        finally:
+            self.jobs -= 1
+
+
+class Resources:
+    """
+    Connections a worker shares between its requests: the async Redis pool, the database engine
+    and the outgoing mail queue with its SMTP connections. Nothing connects at import; open() creates them
+    when the worker starts and opens connections ahead of the first requests, close() releases them on shutdown.
+    Code running outside the application (scripts, tests, benchmarks) gets them created on first use.
+    """
+
+    def __init__(self, db: Database):
+        self.database = db
+        self._redis = None
+        self._mail = None
+
+    @property
+    def redis(self) -> aioredis.Redis:
+        """
+        The redis function returns the async Redis client of the worker, creating it on first use.
+
+        :param self: Represent the instance of the class
+        :return: The client
+        """
+        if self._redis is None:
+            self._redis = aioredis.Redis(connection_pool=aioredis.ConnectionPool(
+                host=settings.redis_host,
+                port=settings.redis_port,
+                db=0,
+                encoding="utf-8",
+                decode_responses=True,
+                max_connections=settings.redis_max_connections,
+            ))
+        return self._redis
+
+    @property
+    def mail(self) -> 'MailQueue':
+        """
+        The mail function returns the outgoing mail queue of the worker, creating it on first use.
+
+        :param self: Represent the instance of the class
+        :return: The queue
+        """
+        if self._mail is None:
+            # send_email imports the services that import this module, so it is imported on first use
+            from src.services.send_email import MailQueue
+            self._mail = MailQueue(workers=settings.mail_workers, batch_size=settings.mail_batch_size,
+                                   max_size=settings.mail_queue_size, max_retries=settings.mail_max_retries,
+                                   retry_delay=settings.mail_retry_delay, idle_timeout=settings.mail_idle_timeout)
+        return self._mail
+
+    async def open(self) -> None:
+        """
+        The open function warms the Redis and database pools with settings.redis_warm_connections
+        and settings.db_warm_connections connections (at most db_pool_size), then starts the mail queue.
+        A backend that is down does not stop the worker from starting; its requests fail as they would without warming.
+
+        :param self: Represent the instance of the class
+        :return: None
+        """
+        results = await asyncio.gather(
+            asyncio.gather(*(self.redis.ping() for _ in range(settings.redis_warm_connections))),
+            self.database.warm(min(settings.db_warm_connections, settings.db_pool_size)),
+            return_exceptions=True,
+        )
+        for name, result in zip(('Redis', 'database'), results):
+            if isinstance(result, Exception):
+                logger.warning('Could not warm the %s connections: %s', name, result)
+        await self.mail.start()
+
+    async def close(self) -> None:
+        """
+        The close function gives the mail queue a few seconds to send what is still queued,
+        then closes every pooled SMTP, Redis and database connection.
+
+        :param self: Represent the instance of the class
+        :return: None
+        """
+        if self._mail is not None:
+            await self._mail.stop()
+            self._mail = None
+        if self._redis is not None:
+            await self._redis.close()
+            await self._redis.connection_pool.disconnect()
+            self._redis = None
+        await self.database.dispose()
+
+
+resources = Resources(database)
+
@@ -1,52 +1,386 @@
+import asyncio
+import logging
+import time
+from email.message import Message
+from email.mime.text import MIMEText
+from email.utils import formataddr, formatdate, make_msgid
+from functools import lru_cache
 from pathlib import Path
+from typing import TYPE_CHECKING, Iterable, Iterator
 
-from fastapi_mail import FastMail, MessageSchema, ConnectionConfig, MessageType
-from fastapi_mail.errors import ConnectionErrors
+import aiosmtplib
+from jinja2 import Environment, FileSystemLoader, Template, select_autoescape
 from pydantic import EmailStr
 
 from src.config.config import settings
+from src.database.models import User
 from src.services.auth import auth_service
+from src.services.resources import resources
 
-conf = ConnectionConfig(
-    MAIL_USERNAME=settings.mail_username,
-    MAIL_PASSWORD=settings.mail_password,
-    MAIL_FROM=EmailStr(settings.mail_from),
-    MAIL_PORT=settings.mail_port,
-    MAIL_SERVER=settings.mail_server,
-    MAIL_FROM_NAME="Desired Name",
-    MAIL_STARTTLS=False,
-    MAIL_SSL_TLS=True,
-    USE_CREDENTIALS=True,
-    VALIDATE_CERTS=True,
-    TEMPLATE_FOLDER=Path(__file__).parent / 'templates',
-)
+if TYPE_CHECKING:
+    from fastapi_mail import ConnectionConfig
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE_FOLDER = Path(__file__).parent / 'templates'
+SENDER_NAME = "Desired Name"
+
+
+@lru_cache
+def mail_config() -> 'ConnectionConfig':
+    """
+    The mail_config function returns the connection settings of the SMTP server, built on first use.
+    Importing fastapi_mail takes longer than the rest of the mail service, so the worker
+    does not pay for it until the first connection.
+
+    :return: The connection settings
+    """
+    from fastapi_mail import ConnectionConfig
+    return ConnectionConfig(
+        MAIL_USERNAME=settings.mail_username,
+        MAIL_PASSWORD=settings.mail_password,
+        MAIL_FROM=EmailStr(settings.mail_from),
+        MAIL_PORT=settings.mail_port,
+        MAIL_SERVER=settings.mail_server,
+        MAIL_FROM_NAME=SENDER_NAME,
+        MAIL_STARTTLS=False,
+        MAIL_SSL_TLS=True,
+        USE_CREDENTIALS=True,
+        VALIDATE_CERTS=True,
+        TEMPLATE_FOLDER=TEMPLATE_FOLDER,
+    )
+
+
+# Templates are compiled once at import; with auto_reload off get_template never checks the files again
+templates = Environment(loader=FileSystemLoader(TEMPLATE_FOLDER), autoescape=select_autoescape(['html']),
+                        auto_reload=False, cache_size=-1)
+compiled_templates = {name: templates.get_template(name) for name in templates.list_templates()}
+SENDER = formataddr((SENDER_NAME, settings.mail_from))
+MESSAGE_ID_DOMAIN = settings.mail_from.split('@')[-1]
+
+
+class MailQueue:
+    """
+    In-process queue of outgoing emails. Workers take up to batch_size messages at a time and send them over
+    an SMTP connection they keep open between batches (and close after idle_timeout seconds without mail).
+    A message that fails with a temporary error is retried after retry_delay, 2 * retry_delay, ... seconds,
+    at most max_retries times; permanent (5xx) rejections are not retried.
+    Without a config the queue connects with mail_config().
+    """
+
+    def __init__(self, config: 'ConnectionConfig | None' = None, workers: int = 2, batch_size: int = 20, max_size: int = 1000,
+                 max_retries: int = 5, retry_delay: float = 1.0, idle_timeout: float = 60.0):
+        self.config = config
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.idle_timeout = idle_timeout
+        self.queue = asyncio.Queue(max_size)
+        self.tasks = []
+        self.retrying = set()
+        self.connections = 0
+        self.counters = {'sent': 0, 'retried': 0, 'failed': 0, 'dropped': 0, 'connects': 0}
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    def put(self, message: Message, attempts: int = 0, enqueued_at: float | None = None) -> bool:
+        """
+        The put function adds a message to the queue without waiting. When the queue is full the message
+        is dropped and counted, so a mail outage cannot grow the memory of the worker without bound.
+
+        :param self: Represent the instance of the class
+        :param message: Message: The message to send
+        :param attempts: int: Number of failed attempts so far
+        :param enqueued_at: float | None: time.monotonic() of the first put, for the latency metrics
+        :return: True if the message was queued
+        """
+        try:
+            self.queue.put_nowait((message, attempts, enqueued_at or time.monotonic()))
+        except asyncio.QueueFull:
+            self.counters['dropped'] += 1
+            logger.warning('Mail queue is full, dropped message to %s after %d attempts', message['To'], attempts)
+            return False
+        return True
+
+    async def start(self) -> None:
+        """
+        The start function starts the workers. Messages put before it are sent once it runs.
+
+        :param self: Represent the instance of the class
+        :return: None
+        """
+        self.tasks = [asyncio.create_task(self.worker()) for _ in range(self.workers)]
+
+    async def stop(self, timeout: float = 5.0) -> None:
+        """
+        The stop function waits up to timeout seconds for the queued messages to be sent,
+        then stops the workers and closes their SMTP connections. Pending retries are abandoned.
+
+        :param self: Represent the instance of the class
+        :param timeout: float: Seconds to wait for the queue to drain
+        :return: None
+        """
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        for handle in self.retrying:
+            handle.cancel()
+        self.retrying.clear()
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    async def connect(self) -> aiosmtplib.SMTP:
+        """
+        The connect function opens and authenticates an SMTP connection with the settings of the config.
+
+        :param self: Represent the instance of the class
+        :return: The connected client
+        """
+        config = self.config or mail_config()
+        smtp = aiosmtplib.SMTP(hostname=config.MAIL_SERVER, port=config.MAIL_PORT,
+                               use_tls=config.MAIL_SSL_TLS, start_tls=config.MAIL_STARTTLS,
+                               validate_certs=config.VALIDATE_CERTS, timeout=config.TIMEOUT)
+        await smtp.connect()
+        if config.USE_CREDENTIALS:
+            await smtp.login(config.MAIL_USERNAME, config.MAIL_PASSWORD)
+        self.counters['connects'] += 1
+        self.connections += 1
+        return smtp
+
+    async def worker(self) -> None:
+        """
+        The worker function sends batches of queued messages until it is cancelled.
+
+        :param self: Represent the instance of the class
+        :return: None
+        """
+        smtp = None
+        try:
+            while True:
+                try:
+                    batch = [await asyncio.wait_for(self.queue.get(), self.idle_timeout if smtp else None)]
+                except asyncio.TimeoutError:
+                    smtp = await self.disconnect(smtp)
+                    continue
+                while len(batch) < self.batch_size and not self.queue.empty():
+                    batch.append(self.queue.get_nowait())
+                smtp = await self.send_batch(smtp, batch)
+        finally:
+            await self.disconnect(smtp)
+
+    async def send_batch(self, smtp: aiosmtplib.SMTP | None, batch: list) -> aiosmtplib.SMTP | None:
+        """
+        The send_batch function sends a batch of queued messages over one connection, reconnecting
+        when it was closed, and schedules the failed ones for a retry.
+
+        :param self: Represent the instance of the class
+        :param smtp: aiosmtplib.SMTP | None: The open connection of the worker, if any
+        :param batch: list: Queue items (message, attempts, enqueued_at)
+        :return: The connection to keep for the next batch
+        """
+        for message, attempts, enqueued_at in batch:
+            try:
+                if smtp is not None and not smtp.is_connected:
+                    smtp = await self.disconnect(smtp)
+                if smtp is None:
+                    smtp = await self.connect()
+                await smtp.send_message(message)
+            except (aiosmtplib.SMTPException, OSError) as err:
+                if isinstance(err, aiosmtplib.SMTPResponseException) and err.code == 421 \
+                        or not isinstance(err, (aiosmtplib.SMTPResponseException, aiosmtplib.SMTPRecipientsRefused)):
+                    # The server closes the session on 421 and a connection error leaves it unusable
+                    smtp = await self.disconnect(smtp)
+                self.retry(message, attempts + 1, enqueued_at, err)
+            else:
+                latency = time.monotonic() - enqueued_at
+                self.counters['sent'] += 1
+                self.latency_total += latency
+                self.latency_max = max(self.latency_max, latency)
+            finally:
+                self.queue.task_done()
+        return smtp
+
+    async def disconnect(self, smtp: aiosmtplib.SMTP | None) -> None:
+        """
+        The disconnect function closes a worker connection, politely when it is still open.
+
+        :param self: Represent the instance of the class
+        :param smtp: aiosmtplib.SMTP | None: The connection to close
+        :return: None, to be stored as the new connection of the worker
+        """
+        if smtp is None:
+            return None
+        self.connections -= 1
+        try:
+            await smtp.quit()
+        except (aiosmtplib.SMTPException, OSError):
+            smtp.close()
+        return None
+
+    def retry(self, message: Message, attempts: int, enqueued_at: float, err: Exception) -> None:
+        """
+        The retry function puts a failed message back on the queue after an exponential backoff,
+        or gives up on it when the error is permanent or the retries are used up.
+
+        :param self: Represent the instance of the class
+        :param message: Message: The message that failed
+        :param attempts: int: Number of failed attempts, this one included
+        :param enqueued_at: float: time.monotonic() of the first put
+        :param err: Exception: The error of the last attempt
+        :return: None
+        """
+        permanent = (isinstance(err, aiosmtplib.SMTPResponseException) and err.code >= 500) \
+            or isinstance(err, aiosmtplib.SMTPRecipientsRefused)
+        if permanent or attempts > self.max_retries:
+            self.counters['failed'] += 1
+            logger.error('Mail to %s failed after %d attempts: %s', message['To'], attempts, err)
+            return
+        self.counters['retried'] += 1
+
+        def requeue():
+            self.retrying.discard(handle)
+            self.put(message, attempts, enqueued_at)
+
+        handle = asyncio.get_running_loop().call_later(self.retry_delay * 2 ** (attempts - 1), requeue)
+        self.retrying.add(handle)
+
+    def stats(self) -> dict:
+        """
+        The stats function returns the depth of the queue, the delivery counters and the latency
+        from put to a successful send.
+
+        :param self: Represent the instance of the class
+        :return: A dictionary of counters
+        """
+        sent = self.counters['sent']
+        return {
+            'queued': self.queue.qsize(),
+            'retrying': len(self.retrying),
+            'workers': len(self.tasks),
+            'connections': self.connections,
+            **self.counters,
+            'latency_avg_ms': round(self.latency_total / sent * 1000, 1) if sent else 0.0,
+            'latency_max_ms': round(self.latency_max * 1000, 1),
+        }
+
+
+def get_template(template_name: str) -> Template:
+    """
+    The get_template function returns a compiled template of the templates folder.
+
+    :param template_name: str: Name of the template
+    :return: The template
+    """
+    return compiled_templates.get(template_name) or templates.get_template(template_name)
+
+
+def html_message(recipient: EmailStr, subject: str, html: str) -> Message:
+    """
+    The html_message function wraps a rendered HTML body into a message from the configured sender.
+        It uses the compat32 MIMEText like fastapi_mail did; the EmailMessage header registry
+        is an order of magnitude slower to build, which shows in bulk sends.
+
+    :param recipient: EmailStr: Email address of the recipient
+    :param subject: str: Subject of the message
+    :param html: str: The rendered body
+    :return: The message
+    """
+    message = MIMEText(html, 'html', 'utf-8')
+    message['Subject'] = subject
+    message['From'] = SENDER
+    message['To'] = recipient
+    message['Date'] = formatdate(localtime=True)
+    message['Message-ID'] = make_msgid(domain=MESSAGE_ID_DOMAIN)
+    return message
+
+
+def build_message(recipient: EmailStr, subject: str, template_name: str, template_body: dict) -> Message:
+    """
+    The build_message function renders an HTML template into a message from the configured sender.
+
+    :param recipient: EmailStr: Email address of the recipient
+    :param subject: str: Subject of the message
+    :param template_name: str: Name of the template in the templates folder
+    :param template_body: dict: Variables of the template
+    :return: The message
+    """
+    return html_message(recipient, subject, get_template(template_name).render(template_body))
+
+
+def render_many(template_name: str, contexts: Iterable[dict]) -> Iterator[str]:
+    """
+    The render_many function renders one template for many contexts, looking the template up once.
+
+    :param template_name: str: Name of the template in the templates folder
+    :param contexts: Iterable[dict]: Variables of the template, one dictionary per rendering
+    :return: The rendered bodies, in the order of the contexts
+    """
+    render = get_template(template_name).render
+    for context in contexts:
+        yield render(context)
+
+
+def build_messages(subject: str, template_name: str, recipients: Iterable[tuple[str, dict]]) -> Iterator[Message]:
+    """
+    The build_messages function renders one template into a message for each recipient,
+    for campaigns of thousands of emails.
+
+    :param subject: str: Subject of the messages
+    :param template_name: str: Name of the template in the templates folder
+    :param recipients: Iterable[tuple[str, dict]]: Pairs of email address and template variables
+    :return: The messages, in the order of the recipients
+    """
+    render = get_template(template_name).render
+    for recipient, context in recipients:
+        yield html_message(recipient, subject, render(context))
+
+
+def birthday_reminders(reminders: Iterable[tuple[User, list]]) -> Iterator[Message]:
+    """
+    The birthday_reminders function builds the reminders about the upcoming birthdays of contacts,
+    one message per user, from the users and the results of repository.contacts.birthday_list.
+    Users without upcoming birthdays get no message.
+
+    :param reminders: Iterable[tuple[User, list]]: Pairs of user and the contacts (or rows) with a birthday soon
+    :return: The messages
+    """
+    return build_messages("Upcoming birthdays", "birthday_reminder.html", (
+        (user.email, {"username": user.username, "contacts": contacts})
+        for user, contacts in reminders if contacts
+    ))
+
+
+def queue_messages(messages: Iterable[Message]) -> int:
+    """
+    The queue_messages function puts messages on the mail queue of the worker and returns how many were queued.
+
+    :param messages: Iterable[Message]: The messages
+    :return: The number of queued messages
+    """
+    return sum(resources.mail.put(message) for message in messages)
 
 
 async def send_email(email: EmailStr, username: str, host: str):
     """
-    The send_email function sends an email to the user with a link to confirm their email address.
+    The send_email function queues an email to the user with a link to confirm their email address.
         The function takes in three parameters:
             -email: EmailStr, the user's email address.
             -username: str, the username of the user who is registering for an account.
                 This will be used in a greeting message within the body of the email sent to them.
             -host: str, this is where we are hosting our application (i.e., localhost).
                 This will be used as part of a URL that users can click on within their emails.
+        The message is delivered in the background by the mail queue of the worker, so the request does not wait for SMTP.
 
     :param email: EmailStr: Specify the email address of the recipient
     :param username: str: Pass the username to the template
     :param host: str: Make sure that the host is a string
-    :return: A coroutine object, which is a generator-based asynchronous function
-    """
-    try:
-        token_verification = auth_service.create_email_token({"sub": email})
-        message = MessageSchema(
-            subject="Confirm your email ",
-            recipients=[email],
-            template_body={"host": host, "username": username, "token": token_verification},
-            subtype=MessageType.html
-        )
-
-        fm = FastMail(conf)
-        await fm.send_message(message, template_name="email_template.html")
-    except ConnectionErrors as err:
-        print(err)
+    :return: True if the message was queued
+    """
+    token_verification = auth_service.create_email_token({"sub": email})
+    message = build_message(email, "Confirm your email ", "email_template.html",
+                            {"host": host, "username": username, "token": token_verification})
+    return resources.mail.put(message)
@@ -0,0 +1,88 @@
+import json
+from datetime import date, datetime
+from typing import Any, Iterable, List
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import parse_obj_as
+
+from src.config.config import settings
+from src.schemas import ContactResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Keys of a serialized contact, in the order ContactResponse declares them
+RESPONSE_FIELDS = tuple(ContactResponse.__fields__)
+
+
+def _default(value):
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+def dumps(content: Any) -> bytes:
+    """
+    The dumps function encodes content the way JSONResponse does (compact, UTF-8, dates in ISO format),
+    with orjson when it is installed and the standard library otherwise.
+
+    :param content: Any: Lists, dictionaries, strings, numbers and dates
+    :return: The JSON document
+    """
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(',', ':'), default=_default).encode()
+
+
+def contact_dict(row: Any, fields: tuple = RESPONSE_FIELDS) -> dict:
+    """
+    The contact_dict function turns a row of the response columns into the dictionary ContactResponse would
+    serialize to, without validating it.
+
+    :param row: Any: A row with the ContactResponse fields as attributes
+    :param fields: tuple: The fields to include, in RESPONSE_FIELDS order
+    :return: A dictionary with the ContactResponse keys
+    """
+    data = {field: getattr(row, field) for field in fields}
+    if isinstance(data.get('birthday'), datetime):
+        data['birthday'] = data['birthday'].date()
+    return data
+
+
+def render_contacts(contacts: Any, many: bool = True, fields: tuple | None = None) -> str:
+    """
+    The render_contacts function serializes contacts to the JSON body FastAPI would send for ContactResponse.
+        With settings.fast_json or a sparse fieldset the contacts are rows of the response columns, encoded
+        directly by dumps; otherwise they are ORM objects validated through ContactResponse and encoded
+        by JSONResponse. Both give the same bytes.
+
+    :param contacts: Any: A contact or a list of contacts
+    :param many: bool: Whether contacts is a list
+    :param fields: tuple | None: Sparse fieldset, in RESPONSE_FIELDS order
+    :return: The JSON body
+    """
+    if settings.fast_json or fields:
+        fields = fields or RESPONSE_FIELDS
+        content = [contact_dict(row, fields) for row in contacts] if many else contact_dict(contacts, fields)
+        return dumps(content).decode()
+    model = List[ContactResponse] if many else ContactResponse
+    return JSONResponse(jsonable_encoder(parse_obj_as(model, contacts))).body.decode()
+
+
+def render_lines(contacts: Iterable, fields: tuple | None = None) -> str:
+    """
+    The render_lines function serializes contacts as NDJSON lines, one ContactResponse per line.
+        Lines keep the format of ContactResponse.json() (stdlib separators, ASCII only), so the fast path
+        skips validation but not the standard library encoder.
+
+    :param contacts: Iterable: Rows of the response columns with settings.fast_json or fields, ORM objects otherwise
+    :param fields: tuple | None: Sparse fieldset, in RESPONSE_FIELDS order
+    :return: The NDJSON lines
+    """
+    if settings.fast_json or fields:
+        fields = fields or RESPONSE_FIELDS
+        return ''.join(json.dumps(contact_dict(row, fields), default=_default) + '\n' for row in contacts)
+    return ''.join(ContactResponse.from_orm(contact).json() + '\n' for contact in contacts)
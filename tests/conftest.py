@@ -6,7 +6,7 @@ from sqlalchemy.orm import sessionmaker
 
 from ..main import app
 from ..src.database.models import Base
-from ..src.database.db import get_db
+from ..src.database.db import get_db, SyncSessionAdapter
 
 
 SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
@@ -35,9 +35,9 @@ def session():
 def client(session):
     # Dependency override
 
-    def override_get_db():
+    async def override_get_db():
         try:
-            yield session
+            yield SyncSessionAdapter(session)
         finally:
             session.close()
 
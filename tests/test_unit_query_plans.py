@@ -0,0 +1,178 @@
+"""
+EXPLAIN checks for the repository queries: every statement they send must reach contacts and users
+through an index, at a realistic table size. Runs on SQLite by default; set EXPLAIN_DATABASE_URL
+to a disposable PostgreSQL database (its tables are dropped) to check the PostgreSQL plans as well.
+"""
+import json
+import os
+import unittest
+from datetime import date, datetime, timedelta
+from unittest.mock import AsyncMock, patch
+
+from sqlalchemy import create_engine, event, insert, text
+from sqlalchemy.orm import sessionmaker
+
+from src.database.db import SyncSessionAdapter
+from src.database.models import Base, Contact, User
+from src.repository import contacts as repository_contacts
+from src.repository import users as repository_users
+from src.schemas import ContactModel, ContactOperation
+
+DATABASE_URL = os.environ.get('EXPLAIN_DATABASE_URL', 'sqlite://')
+USERS = 1000
+CONTACTS_PER_USER = 50
+TABLES = ('contacts', 'users')
+
+
+def seed(engine):
+    """
+    The seed function recreates the schema with USERS users owning CONTACTS_PER_USER contacts each
+    and refreshes the planner statistics.
+
+    :param engine: Engine to seed
+    :return: None
+    """
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    today = datetime.combine(date.today(), datetime.min.time())
+    with engine.begin() as connection:
+        connection.execute(insert(User), [
+            {'id': user_id, 'username': f'user{user_id}', 'email': f'user{user_id}@example.com', 'password': 'hash'}
+            for user_id in range(1, USERS + 1)
+        ])
+        connection.execute(insert(Contact), [
+            {
+                'name': f'Name{number % 997}',
+                'surname': f'Surname{number % 1009}',
+                'email': f'contact{number}@example.com',
+                'phone': f'063{number:08d}',
+                'birthday': today - timedelta(days=number * 7 % 36500),
+                'user_id': number % USERS + 1,
+            }
+            for number in range(USERS * CONTACTS_PER_USER)
+        ])
+        connection.execute(text('ANALYZE'))
+
+
+def plan_problems(connection, statement: str, parameters, ordered: bool = False) -> list:
+    """
+    The plan_problems function explains a statement and returns the plan steps that read contacts or users
+    without an index (full scans and SQLite skip-scans), and with ordered also the steps that sort.
+
+    :param connection: Connection to explain the statement on
+    :param statement: str: SQL as sent to the database
+    :param parameters: Parameters sent with it
+    :param ordered: bool: Whether the rows must come out of the index already in order
+    :return: A list of plan steps
+    """
+    steps = []
+    if connection.dialect.name == 'sqlite':
+        for row in connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters):
+            words = row.detail.split(' ')
+            full_scan = words[0] == 'SCAN' and 'INDEX' not in row.detail
+            if len(words) > 1 and words[1] in TABLES and (full_scan or '(ANY(' in row.detail):
+                steps.append(row.detail)
+            if ordered and row.detail.startswith('USE TEMP B-TREE'):
+                steps.append(row.detail)
+        return steps
+    plan = connection.exec_driver_sql(f'EXPLAIN (FORMAT JSON) {statement}', parameters).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    nodes = [plan[0]['Plan']]
+    while nodes:
+        node = nodes.pop()
+        nodes.extend(node.get('Plans', ()))
+        if node['Node Type'] == 'Seq Scan' and node.get('Relation Name') in TABLES:
+            steps.append(f"Seq Scan on {node['Relation Name']}")
+        if ordered and node['Node Type'] in ('Sort', 'Incremental Sort'):
+            steps.append(node['Node Type'])
+    return steps
+
+
+@patch('src.repository.contacts.cache', AsyncMock())
+@patch('src.repository.users.cache', AsyncMock())
+class TestQueryPlans(unittest.IsolatedAsyncioTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.engine = create_engine(DATABASE_URL)
+        seed(cls.engine)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.engine.dispose()
+
+    def setUp(self):
+        self.statements = []
+        event.listen(self.engine, 'before_cursor_execute', self.capture)
+        self.session = SyncSessionAdapter(sessionmaker(bind=self.engine)())
+        self.user = User(id=USERS // 2)
+
+    async def asyncTearDown(self):
+        await self.session.close()
+        event.remove(self.engine, 'before_cursor_execute', self.capture)
+
+    def capture(self, connection, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().split(' ')[0] in ('SELECT', 'UPDATE', 'DELETE', 'WITH'):
+            self.statements.append((statement, parameters))
+
+    def assertIndexed(self, ordered: bool = False):
+        self.assertTrue(self.statements)
+        with self.engine.connect() as connection:
+            for statement, parameters in self.statements:
+                self.assertEqual(plan_problems(connection, statement, parameters, ordered), [], statement)
+        self.statements.clear()
+
+    async def test_contacts_reads(self):
+        page = await repository_contacts.get_contacts(self.user, self.session, limit=20, after=0)
+        self.assertIndexed(ordered=True)
+        await repository_contacts.get_contacts(self.user, self.session, limit=20, after=page[-1].id)
+        self.assertIndexed(ordered=True)
+        await repository_contacts.get_contact(page[0].id, self.user, self.session)
+        self.assertIndexed()
+        self.assertEqual(len([contact async for contact in repository_contacts.stream_contacts(
+            self.user, self.session, columns=repository_contacts.RESPONSE_COLUMNS)]), CONTACTS_PER_USER)
+        self.assertIndexed()
+        self.assertEqual(sum([len(rows) async for rows in repository_contacts.export_contacts(
+            self.user, self.session)]), CONTACTS_PER_USER)
+        self.assertIndexed()
+
+    async def test_birthday_list(self):
+        self.assertIsInstance(await repository_contacts.birthday_list(self.user, self.session, 7), list)
+        self.assertIndexed()
+
+    async def test_searcher(self):
+        if self.engine.dialect.name == 'postgresql':
+            with self.engine.connect() as connection:
+                if not connection.scalar(text("SELECT count(*) FROM pg_extension WHERE extname = 'pg_trgm'")):
+                    self.skipTest('pg_trgm is not installed')
+        self.assertTrue(await repository_contacts.searcher('Surname58', self.user, self.session))
+        self.assertIndexed()
+
+    async def test_contacts_writes(self):
+        page = await repository_contacts.get_contacts(self.user, self.session, limit=3)
+        self.statements.clear()
+        body = ContactModel(name='Will', surname='Scot', email='will.scot@example.com', phone='0630000000',
+                            birthday=date(1990, 1, 2))
+        self.assertIsNotNone(await repository_contacts.update_contact(body, page[0].id, self.user, self.session))
+        self.assertIndexed()
+        self.assertIsNotNone(await repository_contacts.remove_contact(page[0].id, self.user, self.session))
+        self.assertIndexed()
+        operations = [ContactOperation(op='update', id=page[1].id, contact=body),
+                      ContactOperation(op='delete', id=page[2].id)]
+        await repository_contacts.batch_contacts(operations, self.user, self.session)
+        self.assertIndexed()
+
+    async def test_users(self):
+        self.assertIsNotNone(await repository_users.get_user_by_email('user7@example.com', self.session))
+        self.assertIndexed()
+        self.assertIsNotNone(await repository_users.get_user_by_username('user7', self.session))
+        self.assertIndexed()
+        user = await repository_users.get_user_by_email('user8@example.com', self.session)
+        self.statements.clear()
+        await repository_users.update_token(user, 'token', self.session)
+        self.assertIndexed()
+
+
+if __name__ == '__main__':
+    unittest.main()
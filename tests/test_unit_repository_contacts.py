@@ -1,10 +1,15 @@
 import unittest
 from datetime import date, timedelta, datetime
-from unittest.mock import MagicMock
+from unittest.mock import AsyncMock, MagicMock, patch
 
-from sqlalchemy.orm import Session
+from sqlalchemy import create_engine, inspect
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
 
-from src.database.models import User, Contact
+from src.database.db import SyncSessionAdapter
+
+from src.database.models import Base, User, Contact
 from src.repository.contacts import (
     create_contact,
     get_contact,
@@ -12,19 +17,29 @@ from src.repository.contacts import (
     remove_contact,
     birthday_list,
     get_contacts,
-    searcher
+    searcher,
+    stream_contacts,
+    batch_contacts,
+    response_columns
 )
-from src.schemas import ContactModel, UserModel
+from src.schemas import ContactModel, ContactOperation, UserModel
 
 
+@patch('src.repository.contacts.cache', AsyncMock())
 class TestContacts(unittest.IsolatedAsyncioTestCase):
 
     def setUp(self):
-        self.session = MagicMock(spec=Session)
+        self.session = AsyncMock(spec=AsyncSession)
         self.user = User(id=1)
 
+    @staticmethod
+    def sqlite_session():
+        engine = create_engine('sqlite://')
+        Base.metadata.create_all(bind=engine)
+        return SyncSessionAdapter(sessionmaker(bind=engine)())
+
     def SetUp(self):
-        self.session = MagicMock(spec=Session)
+        self.session = AsyncMock(spec=AsyncSession)
         self.user = UserModel(
             username='Serhii',
             email='sspod@ukr.net',
@@ -71,88 +86,168 @@ class TestContacts(unittest.IsolatedAsyncioTestCase):
 
     async def test_get_contact(self):
         contact = Contact()
-        self.session.query(Contact).filter.return_value.first.return_value = contact
+        self.session.scalar.return_value = contact
         result = await get_contact(contact.id, self.user, self.session)
         self.assertEqual(result, contact)
 
     async def test_get_contacts(self):
         contacts = [Contact(user_id=1), Contact(user_id=1), Contact(user_id=1)]
-        self.session.query().filter().all.return_value = contacts
+        self.session.scalars.return_value = MagicMock(all=MagicMock(return_value=contacts))
         result = await get_contacts(user=self.user, db=self.session)
         self.assertEqual(result, contacts)
 
+    async def test_get_contacts_keyset(self):
+        session = self.sqlite_session()
+        contacts = [Contact(name=f'Name{i}', surname='Surname', email=f'test{i}@test.com', phone=f'063000000{i:02d}',
+                            birthday=datetime.now(), user_id=1)
+                    for i in range(5)]
+        session.add_all(contacts)
+        await session.commit()
+        page = await get_contacts(user=self.user, db=session, limit=2)
+        self.assertEqual(page, contacts[0:2])
+        page = await get_contacts(user=self.user, db=session, limit=2, after=page[-1].id)
+        self.assertEqual(page, contacts[2:4])
+        streamed = [contact async for contact in stream_contacts(self.user, session, batch_size=2)]
+        self.assertEqual(streamed, contacts)
+        await session.close()
+
+    async def test_get_contacts_projection(self):
+        session = self.sqlite_session()
+        session.add(Contact(name='Jon', surname='Smit', email='Jon.smit@test.com', phone='0630987654',
+                            birthday=datetime(1990, 5, 1), description='x' * 10000, user_id=1))
+        await session.commit()
+        session.expunge_all()
+        contacts = await get_contacts(user=self.user, db=session)
+        self.assertTrue({'description', 'created_at', 'user_id'} <= inspect(contacts[0]).unloaded)
+        rows = await get_contacts(user=self.user, db=session, columns=response_columns(('email',)))
+        self.assertEqual(rows[0]._fields, ('id', 'email'))
+        self.assertEqual(tuple(rows[0]), (contacts[0].id, 'Jon.smit@test.com'))
+        await session.close()
+
     async def test_get_contact_not_found(self):
         contact = Contact()
-        self.session.query(Contact).filter.return_value.first.return_value = None
+        self.session.scalar.return_value = None
         result = await get_contact(contact.id, self.user, self.session)
         self.assertIsNone(result)
 
     async def test_update_contact(self):
-        contact_id = 1
-        body = self.contact
-        new_body = self.test_contact1
-        contact = Contact(
-            id=contact_id,
-            name=new_body.name,
-            surname=new_body.surname,
-            email=new_body.email,
-            phone=new_body.phone,
-            birthday=date.today(),
-            )
-        self.session.query(Contact).filter.return_value.first.return_value = contact
-        result = await update_contact(body, contact_id, self.user, self.session)
+        session = self.sqlite_session()
+        contact = Contact(name='Jon', surname='Smit', email='Jon.smit@test.com', phone='0630987654',
+                          birthday=datetime(1990, 5, 1), user_id=1)
+        session.add(contact)
+        await session.commit()
+        body = ContactModel(name='Will', surname='Scot', email='Will.scot@test.com', phone='0630987634',
+                            birthday=date(1992, 7, 3))
+        result = await update_contact(body, contact.id, self.user, session)
         self.assertEqual(result.name, body.name)
         self.assertEqual(result.surname, body.surname)
         self.assertEqual(result.email, body.email)
         self.assertEqual(result.phone, body.phone)
-        self.assertEqual(result.birthday, body.birthday)
-        self.assertTrue(hasattr(result, "id"))
+        self.assertEqual(result.birthday.date(), body.birthday)
+        self.assertEqual(result.id, contact.id)
+        self.assertEqual((await get_contact(contact.id, self.user, session)).birthday_md, 703)
+        result = await update_contact(body, contact.id, User(id=2), session)
+        self.assertIsNone(result)
+        await session.close()
 
     async def test_remove_contact(self):
         contact_id = 1
-        contact = Contact(id=contact_id)
-        self.session.query(Contact).filter.return_value.first.return_value = contact
+        self.session.execute.return_value = MagicMock(scalar=MagicMock(return_value=contact_id))
         result = await remove_contact(contact_id, self.user, self.session)
-        self.assertEqual(result, contact)
+        self.assertEqual(result, contact_id)
+        self.session.execute.assert_awaited_once()
+        self.session.commit.assert_awaited_once()
 
     async def test_get_birthday_list(self):
-        contacts = [Contact(birthday=datetime.now() + timedelta(days=1)),
-                    Contact(birthday=datetime.now() + timedelta(days=2)),
-                    Contact(birthday=datetime.now() + timedelta(days=3)),
-                    Contact(birthday=datetime.now() + timedelta(days=4)),
-                    Contact(birthday=datetime.now() + timedelta(days=5)),
-                    Contact(birthday=datetime.now() + timedelta(days=6)),
-                    Contact(birthday=datetime.now() + timedelta(days=7)),
-                    Contact(birthday=datetime.now() + timedelta(days=8)),
-                    Contact(birthday=datetime.now() + timedelta(days=9)),
-                    Contact(birthday=datetime.now() + timedelta(days=10)),
-                    ]
-        self.session.query().all.return_value = contacts
-        result = await birthday_list(db=self.session)
+        session = self.sqlite_session()
+        contacts = [Contact(name=f'Name{i}', surname='Surname', email=f'test{i}@test.com', phone=f'063000000{i:02d}',
+                            birthday=datetime.now() + timedelta(days=i), user_id=1)
+                    for i in range(1, 11)]
+        other = Contact(name='Other', surname='Surname', email='other@test.com', phone='0630000099',
+                        birthday=datetime.now() + timedelta(days=1), user_id=2)
+        session.add_all(contacts + [other])
+        await session.commit()
+        result = await birthday_list(user=self.user, db=session)
         self.assertEqual(result, contacts[0:7])
+        result = await birthday_list(user=self.user, db=session, days=2)
+        self.assertEqual(result, contacts[0:2])
+        await session.close()
+
+    async def test_get_birthday_list_window_edges(self):
+        session = self.sqlite_session()
+        # Today and today + days are inside the window, the day after it is not
+        contacts = [Contact(name=f'Name{i}', surname='Surname', email=f'edge{i}@test.com', phone=f'063100000{i:02d}',
+                            birthday=datetime.combine(date.today() + timedelta(days=i), datetime.min.time()),
+                            user_id=1)
+                    for i in (0, 7, 8)]
+        session.add_all(contacts)
+        await session.commit()
+        result = await birthday_list(user=self.user, db=session, days=7)
+        self.assertEqual(result, contacts[0:2])
+        result = await birthday_list(user=self.user, db=session, days=0)
+        self.assertEqual(result, contacts[0:1])
+        await session.close()
+
+    def test_birthday_key_leap_day(self):
+        contact = Contact(birthday=datetime(2000, 2, 29))
+        self.assertEqual(contact.birthday_md, 229)
+        contact.birthday = datetime(1990, 12, 31)
+        self.assertEqual(contact.birthday_md, 1231)
 
     async def test_searcher(self):
-        contact1 = Contact(
-            name=self.test_contact1.name,
-            surname=self.test_contact1.surname,
-            email=self.test_contact1.email
-        )
-        contact2 = Contact(
-            name=self.test_contact2.name,
-            surname=self.test_contact2.surname,
-            email=self.test_contact2.email
-        )
-        contact3 = Contact(
-            name=self.test_contact3.name,
-            surname=self.test_contact3.surname,
-            email=self.test_contact3.email
-        )
-        self.session.query.return_value.all.return_value = [contact1, contact2, contact3]
-        results = await searcher('Will', self.session)
-
-        assert contact1 not in results
-        assert contact2 not in results
-        assert contact3 in results
+        session = self.sqlite_session()
+        contact1 = Contact(name='Jon', surname='Smit', email='Jon.smit@test.com', phone='0630987654',
+                           birthday=datetime.now(), user_id=1)
+        contact2 = Contact(name='Lina', surname='Norington', email='Lina.Norington@test.com', phone='0630987653',
+                           birthday=datetime.now(), user_id=1)
+        contact3 = Contact(name='Will', surname='Scot', email='Will.scot@test.com', phone='0630987634',
+                           birthday=datetime.now(), user_id=1)
+        other = Contact(name='Will', surname='Other', email='will.other@test.com', phone='0630987600',
+                        birthday=datetime.now(), user_id=2)
+        session.add_all([contact1, contact2, contact3, other])
+        await session.commit()
+
+        results = await searcher('will', self.user, session)
+        self.assertEqual(results, [contact3])
+        results = await searcher('0630', self.user, session)
+        self.assertEqual(results, [contact1, contact2, contact3])
+        page = await searcher('0630', self.user, session, limit=2, offset=1)
+        self.assertEqual(page, results[1:])
+        await session.close()
+
+    async def test_batch_contacts(self):
+        session = self.sqlite_session()
+        contact1 = Contact(name='Jon', surname='Smit', email='Jon.smit@test.com', phone='0630987654',
+                           birthday=datetime(1990, 5, 1), user_id=1)
+        contact2 = Contact(name='Lina', surname='Norington', email='Lina.Norington@test.com', phone='0630987653',
+                           birthday=datetime(1991, 6, 2), user_id=2)
+        session.add_all([contact1, contact2])
+        await session.commit()
+        body = ContactModel(name='Will', surname='Scot', email='Will.scot@test.com', phone='0630987634',
+                            birthday=date(1992, 7, 3))
+        operations = [
+            ContactOperation(op='create', contact=body),
+            ContactOperation(op='update', id=contact1.id, contact=body.copy(update={'email': 'jon@test.com',
+                                                                                    'phone': '0630000001'})),
+            ContactOperation(op='update', id=contact2.id, contact=body.copy(update={'email': 'lina@test.com',
+                                                                                    'phone': '0630000002'})),
+            ContactOperation(op='delete', id=contact2.id),
+        ]
+        results = await batch_contacts(operations, self.user, session)
+        self.assertEqual([result['status'] for result in results], [201, 200, 404, 404])
+        self.assertEqual(results[0]['contact'].email, 'Will.scot@test.com')
+        self.assertEqual(results[1]['contact'].email, 'jon@test.com')
+        contact = await get_contact(contact1.id, self.user, session)
+        self.assertEqual((contact.name, contact.birthday_md), ('Will', 703))
+
+        results = await batch_contacts([ContactOperation(op='delete', id=contact.id)], self.user, session)
+        self.assertEqual(results[0]['status'], 204)
+        with self.assertRaises(IntegrityError):
+            await batch_contacts([ContactOperation(op='create', contact=body.copy(update={'phone': '0630000003'})),
+                                  ContactOperation(op='create', contact=body)], self.user, session)
+        contacts = await get_contacts(user=self.user, db=session)
+        self.assertEqual([contact.email for contact in contacts], ['Will.scot@test.com'])
+        await session.close()
 
 
 if __name__ == '__main__':
@@ -1,7 +1,7 @@
 import unittest
-from unittest.mock import MagicMock, patch
+from unittest.mock import AsyncMock, patch
 
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database.models import User
 from src.schemas import UserModel
@@ -15,10 +15,11 @@ from src.repository.users import (
 )
 
 
+@patch('src.repository.users.cache', AsyncMock())
 class TestUser(unittest.IsolatedAsyncioTestCase):
 
     def SetUp(self):
-        self.session = MagicMock(spec=Session)
+        self.session = AsyncMock(spec=AsyncSession)
         self.user = UserModel(
             username='Serhii',
             email='sspod@ukr.net',
@@ -30,36 +31,36 @@ class TestUser(unittest.IsolatedAsyncioTestCase):
         with patch.object(self.session, "add") as mock_add, \
                 patch.object(self.session, "commit") as mock_commit, \
                 patch.object(self.session, "refresh") as mock_refresh:
-            user = create_user(self.user, self.session)
+            user = await create_user(self.user, self.session)
         self.assertIsInstance(user, User)
         self.assertEqual(user.username, self.user.username)
         self.assertEqual(user.email, self.user.email)
         self.assertEqual(user.password, self.user.password)
         self.assertTrue(hasattr(user, 'id'))
         mock_add.assert_called_once_with(user)
-        mock_commit.assert_called_once()
-        mock_refresh.assert_called_once_with(user)
+        mock_commit.assert_awaited_once()
+        mock_refresh.assert_awaited_once_with(user)
 
     async def test_get_user_by_email(self):
         user = User()
-        self.session.query().filter().first.return_value = user
+        self.session.scalar.return_value = user
         result = await get_user_by_email(email=self.user.email, db=self.session)
         self.assertEqual(result, user)
 
     async def test_get_user_by_email_not_found(self):
-        self.session.query().filter().first.return_value = None
+        self.session.scalar.return_value = None
         result = await get_user_by_email(email=self.test_email, db=self.session)
         self.assertIsNone(result)
 
     async def test_user_by_username(self):
         user = User(username=self.user.username)
-        self.session.query().filter().first.return_value = user
+        self.session.scalar.return_value = user
         result = await get_user_by_username(username=self.user.username, db=self.session)
         self.assertEqual(result, user)
 
     async def test_user_by_username_not_found(self):
         user = User(username=self.user.username)
-        self.session.query().filter().first.return_value = None
+        self.session.scalar.return_value = None
         result = await get_user_by_username(username=self.user.username, db=self.session)
         self.assertIsNone(result)
 
@@ -71,7 +72,7 @@ class TestUser(unittest.IsolatedAsyncioTestCase):
 
     async def test_update_avatar(self):
         user = User(email=self.user.email)
-        self.session.query().filter().first.return_value = user
+        self.session.scalar.return_value = user
         result = await update_avatar(user.email, "avatar_url", self.session)
         self.assertEqual(result.avatar, user.avatar)
 
@@ -83,7 +84,7 @@ class TestUser(unittest.IsolatedAsyncioTestCase):
             await update_token(self.user, token, self.session)
 
         self.assertEqual(self.user.refresh_token, token)
-        mock_commit.assert_called_once()
+        mock_commit.assert_awaited_once()
 
 
 if __name__ == '__main__':
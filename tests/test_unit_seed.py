@@ -0,0 +1,48 @@
+import unittest
+
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import Session
+
+from src.database.models import Base, Contact, User
+from src.database.seed import seed, user_email
+from src.services.auth import auth_service
+
+
+class TestSeed(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine('sqlite://')
+        Base.metadata.create_all(bind=self.engine)
+
+    def tearDown(self):
+        self.engine.dispose()
+
+    def test_seed(self):
+        with Session(self.engine) as db:
+            self.assertEqual(seed(db, 3, 4, password='secret', batch=5), range(1, 4))
+            self.assertEqual(seed(db, 2, 1, batch=5), range(4, 6))
+            self.assertEqual(db.scalar(select(func.count()).select_from(Contact)), 14)
+            self.assertEqual(db.scalar(select(func.count(Contact.email.distinct()))), 14)
+            self.assertEqual(db.scalar(select(func.count()).where(Contact.created_at.is_(None))), 0)
+            owners = db.execute(select(Contact.user_id, func.count()).group_by(Contact.user_id)).all()
+            self.assertEqual(dict(owners), {1: 4, 2: 4, 3: 4, 4: 1, 5: 1})
+            user = db.scalar(select(User).where(User.id == 2))
+            self.assertEqual(user.email, user_email(2))
+            self.assertTrue(user.confirmed)
+            self.assertTrue(auth_service.pwd_context.verify('secret', user.password))
+
+    def test_seed_is_reproducible(self):
+        names = []
+        for workers in (1, 2):
+            with Session(self.engine) as db:
+                seed(db, 4, 5, random_seed=7, batch=3, workers=workers)
+                names.append(db.execute(select(Contact.surname, Contact.email, Contact.user_id)
+                                        .order_by(Contact.id)).all())
+            Base.metadata.drop_all(bind=self.engine)
+            Base.metadata.create_all(bind=self.engine)
+        self.assertEqual(len(names[0]), 20)
+        self.assertEqual(names[0], names[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
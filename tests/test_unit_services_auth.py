@@ -0,0 +1,46 @@
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from fastapi import HTTPException
+from jose import jwt
+
+from src.services import cache
+from src.services.auth import Auth
+from src.services.messages import SERVICE_BUSY
+from src.config.config import settings
+
+
+class TestAuth(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.auth = Auth()
+
+    async def test_password_hash(self):
+        hashed = await self.auth.get_password_hash('0987654321')
+        self.assertNotEqual(hashed, '0987654321')
+        self.assertTrue(await self.auth.verify_password('0987654321', hashed))
+        self.assertFalse(await self.auth.verify_password('1234567890', hashed))
+        self.assertEqual(self.auth.password_executor.jobs, 0)
+
+    async def test_password_hash_busy(self):
+        limit = settings.password_hash_workers + settings.password_hash_queue
+        with patch.object(self.auth.password_executor, 'jobs', limit), self.assertRaises(HTTPException) as error:
+            await self.auth.get_password_hash('0987654321')
+        self.assertEqual(error.exception.status_code, 503)
+        self.assertEqual(error.exception.detail, SERVICE_BUSY)
+        self.assertEqual(error.exception.headers, {'Retry-After': '1'})
+
+    async def test_get_current_user_without_exp(self):
+        user = MagicMock()
+        token = jwt.encode({'sub': 'test@test.com', 'scope': 'access_token'}, self.auth.SECRET_KEY,
+                           algorithm=self.auth.ALGORITHM)
+        no_scope = jwt.encode({'sub': 'test@test.com'}, self.auth.SECRET_KEY, algorithm=self.auth.ALGORITHM)
+        with patch.object(cache, 'get_user', AsyncMock(return_value=user)):
+            self.assertIs(await self.auth.get_current_user(token, AsyncMock()), user)
+            with self.assertRaises(HTTPException) as error:
+                await self.auth.get_current_user(no_scope, AsyncMock())
+        self.assertEqual(error.exception.status_code, 401)
+        cache.token_l1.clear()
+
+if __name__ == '__main__':
+    unittest.main()
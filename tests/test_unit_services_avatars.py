@@ -0,0 +1,78 @@
+import io
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from fastapi import HTTPException, UploadFile
+from PIL import Image
+
+from src.database.models import User
+from src.services import avatars
+from src.services.avatars import LocalStorage, CloudinaryStorage
+
+
+def upload(color: str, size: tuple = (640, 480), fmt: str = 'PNG', mode: str = 'RGB') -> UploadFile:
+    data = io.BytesIO()
+    Image.new(mode, size, color).save(data, fmt)
+    data.seek(0)
+    return UploadFile(filename=f'avatar.{fmt.lower()}', file=data)
+
+
+class TestAvatars(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.root = tempfile.TemporaryDirectory()
+        self.storage = LocalStorage(self.root.name, '/static/avatars')
+        patcher = patch.object(avatars, 'storage', self.storage)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.root.cleanup)
+        self.user = User(id=7, username='Serhii', email='sspod@ukr.net', avatar='https://www.gravatar.com/avatar/1')
+
+    async def test_save_avatar(self):
+        url, previous = await avatars.save_avatar(upload('red'), self.user)
+        self.assertIsNone(previous)
+        self.assertRegex(url, r'^/static/avatars/7/[0-9a-f]{16}\.jpg$')
+        path = Path(self.root.name) / self.storage.name(url)
+        with Image.open(path) as image:
+            self.assertEqual((image.format, image.size, image.mode), ('JPEG', (250, 250), 'RGB'))
+            self.assertGreater(image.getpixel((125, 125))[0], 240)
+        self.user.avatar = url
+
+        with patch.object(avatars, 'normalize') as normalize, patch.object(self.storage, 'save') as save:
+            self.assertIsNone(await avatars.save_avatar(upload('red'), self.user))
+        normalize.assert_not_called()
+        save.assert_not_called()
+
+        new_url, previous = await avatars.save_avatar(upload((0, 0, 255, 0), fmt='PNG', mode='RGBA'), self.user)
+        self.assertNotEqual(new_url, url)
+        self.assertEqual(previous, self.storage.name(url))
+        self.assertTrue(path.exists())
+        await avatars.delete_avatar(previous)
+        self.assertFalse(path.exists())
+        with Image.open(Path(self.root.name) / self.storage.name(new_url)) as image:
+            self.assertEqual(image.getpixel((125, 125)), (255, 255, 255))
+        self.assertEqual(list(Path(tempfile.gettempdir()).glob('avatar-*')), [])
+
+    async def test_invalid_upload(self):
+        with self.assertRaises(HTTPException) as error:
+            await avatars.save_avatar(UploadFile(filename='a.png', file=io.BytesIO(b'not an image')), self.user)
+        self.assertEqual(error.exception.status_code, 415)
+        with patch.object(avatars.settings, 'avatar_max_bytes', 100), self.assertRaises(HTTPException) as error:
+            await avatars.save_avatar(upload('red', fmt='BMP'), self.user)
+        self.assertEqual(error.exception.status_code, 413)
+        self.assertEqual(list(Path(self.root.name).iterdir()), [])
+
+    def test_storage_names(self):
+        self.assertEqual(self.storage.name('/static/avatars/7/abc.jpg'), '7/abc.jpg')
+        self.assertIsNone(self.storage.name('https://www.gravatar.com/avatar/1'))
+        cloud = CloudinaryStorage('name', 1, 'secret')
+        url = 'https://res.cloudinary.com/name/image/upload/v1679/ContactsApp/7/abc.jpg'
+        self.assertEqual(cloud.name(url), '7/abc.jpg')
+        self.assertEqual(cloud.public_id('7/abc.jpg'), 'ContactsApp/7/abc')
+        self.assertIsNone(cloud.name('https://www.gravatar.com/avatar/1'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import unittest
+from datetime import datetime
+from unittest.mock import AsyncMock, patch
+
+from src.database.models import User
+from src.services import cache
+from src.services.resources import resources
+
+
+class TestCache(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        cache.user_l1.clear()
+        self.user = User(id=1, username='Serhii', email='sspod@ukr.net', password='hash', refresh_token='token',
+                         created_at=datetime(2023, 3, 15, 11, 32, 41), avatar='avatar_url', confirmed=True)
+
+    def test_dump_load_user(self):
+        snapshot = cache.dump_user(self.user)
+        self.assertNotIn('hash', snapshot)
+        self.assertNotIn('token', snapshot)
+        user = cache.load_user(snapshot)
+        self.assertIsInstance(user, User)
+        for field in cache.USER_SNAPSHOT_FIELDS + ('created_at',):
+            self.assertEqual(getattr(user, field), getattr(self.user, field))
+
+    async def test_set_user(self):
+        with patch.object(resources, '_redis', AsyncMock()) as redis_mock:
+            await cache.set_user(self.user)
+        redis_mock.set.assert_awaited_once_with(cache.user_key(self.user.email), cache.dump_user(self.user),
+                                                ex=cache.settings.user_cache_ttl)
+
+    async def test_get_user(self):
+        with patch.object(resources, '_redis', AsyncMock()) as redis_mock:
+            redis_mock.get.return_value = cache.dump_user(self.user)
+            user = await cache.get_user(self.user.email)
+            self.assertEqual(user.id, self.user.id)
+            user = await cache.get_user(self.user.email)
+            self.assertEqual(user.id, self.user.id)
+            redis_mock.get.assert_awaited_once()
+            redis_mock.get.return_value = None
+            self.assertIsNone(await cache.get_user('missing@ukr.net'))
+
+    async def test_invalidate_user(self):
+        with patch.object(resources, '_redis', AsyncMock()) as redis_mock:
+            await cache.set_user(self.user)
+            await cache.invalidate_user(self.user.email)
+        redis_mock.delete.assert_awaited_once_with(cache.user_key(self.user.email))
+        redis_mock.publish.assert_awaited_once_with(cache.USER_INVALIDATION_CHANNEL, self.user.email)
+        self.assertIsNone(cache.user_l1.get(self.user.email))
+
+    async def test_contacts_generation(self):
+        with patch.object(resources, '_redis', AsyncMock()) as redis_mock:
+            redis_mock.get.return_value = None
+            self.assertEqual(await cache.contacts_generation(1), 0)
+            redis_mock.get.return_value = '3'
+            self.assertEqual(await cache.contacts_generation(1), 3)
+        redis_mock.get.assert_awaited_with(cache.generation_key(1))
+
+    def test_contacts_etag(self):
+        etag = cache.contacts_etag(1, 3, 'all:100:0')
+        self.assertEqual(etag, cache.contacts_etag(1, 3, 'all:100:0'))
+        self.assertTrue(etag.startswith('"') and etag.endswith('"'))
+        self.assertNotEqual(etag, cache.contacts_etag(1, 4, 'all:100:0'))
+        self.assertNotEqual(etag, cache.contacts_etag(2, 3, 'all:100:0'))
+        self.assertNotEqual(etag, cache.contacts_etag(1, 3, 'all:100:100'))
+        self.assertNotIn('"', cache.response_key(etag))
+
+    def test_local_cache_lru(self):
+        local = cache.LocalCache(maxsize=2, ttl=60)
+        local.set('a', 1)
+        local.set('b', 2)
+        self.assertEqual(local.get('a'), 1)
+        local.set('c', 3)
+        self.assertIsNone(local.get('b'))
+        self.assertEqual(local.get('a'), 1)
+        self.assertEqual(local.get('c'), 3)
+        self.assertEqual(local.stats(), {'size': 2, 'hits': 3, 'misses': 1})
+
+    def test_local_cache_ttl(self):
+        local = cache.LocalCache(maxsize=2, ttl=60)
+        local.set('a', 1, ttl=-1)
+        self.assertIsNone(local.get('a'))
+        disabled = cache.LocalCache(maxsize=0, ttl=60)
+        disabled.set('a', 1)
+        self.assertIsNone(disabled.get('a'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import gzip
+import io
+import json
+import unittest
+from datetime import datetime
+
+from src.services.exporter import encode_csv, encode_ndjson, encode_parquet, gzip_chunks, EXPORT_FIELDS
+
+ROWS = [
+    (1, 'Jon', 'Smit', 'Jon.smit@test.com', '0630987654', datetime(1990, 2, 28), None),
+    (2, 'Lina', 'Norington', 'Lina.Norington@test.com', '0630987653', datetime(2000, 2, 29), 'Friend, colleague'),
+]
+
+
+async def batches():
+    yield ROWS[:1]
+    yield ROWS[1:]
+
+
+async def collect(chunks):
+    return b''.join([chunk async for chunk in chunks])
+
+
+class TestExporter(unittest.IsolatedAsyncioTestCase):
+
+    async def test_encode_csv(self):
+        data = await collect(encode_csv(batches()))
+        lines = data.decode().splitlines()
+        self.assertEqual(lines[0], ','.join(EXPORT_FIELDS))
+        self.assertEqual(lines[1], '1,Jon,Smit,Jon.smit@test.com,0630987654,1990-02-28,')
+        self.assertEqual(lines[2], '2,Lina,Norington,Lina.Norington@test.com,0630987653,2000-02-29,"Friend, colleague"')
+
+    async def test_encode_ndjson(self):
+        data = await collect(encode_ndjson(batches()))
+        rows = [json.loads(line) for line in data.decode().splitlines()]
+        self.assertEqual(rows[1]['birthday'], '2000-02-29')
+        self.assertEqual(rows[0]['email'], 'Jon.smit@test.com')
+
+    async def test_encode_parquet(self):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            self.skipTest('pyarrow is not installed')
+        data = await collect(encode_parquet(batches()))
+        table = pq.read_table(io.BytesIO(data))
+        self.assertEqual(table.num_rows, 2)
+        self.assertEqual(table.column('email').to_pylist(), ['Jon.smit@test.com', 'Lina.Norington@test.com'])
+
+    async def test_gzip_chunks(self):
+        data = await collect(gzip_chunks(encode_ndjson(batches())))
+        self.assertEqual(gzip.decompress(data), await collect(encode_ndjson(batches())))
+
+
+if __name__ == '__main__':
+    unittest.main()
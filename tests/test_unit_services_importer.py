@@ -0,0 +1,84 @@
+import io
+import unittest
+from unittest.mock import AsyncMock, patch
+
+from fastapi import HTTPException
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from src.database.db import SyncSessionAdapter
+from src.database.models import Base, User
+from src.services.importer import read_rows, validate_chunk, import_contacts, is_utf8, DUPLICATE_CONTACT
+
+CSV_BODY = (
+    'name,surname,email,phone,birthday\n'
+    'Jon,Smit,Jon.smit@test.com,0630987654,1990-02-28\n'
+    'Lina,Norington,not-an-email,0630987653,1991-03-01\n'
+    'Will,Scot,Jon.smit@test.com,0630987634,2000-02-29\n'
+)
+NDJSON_BODY = (
+    '{"name": "Jon", "surname": "Smit", "email": "Jon.smit@test.com", "phone": "0630987654", "birthday": "1990-02-28"}\n'
+    '\n'
+    '{"name": "Lina"\n'
+)
+
+
+class TestImporter(unittest.IsolatedAsyncioTestCase):
+
+    def test_read_rows_csv(self):
+        rows = list(read_rows(io.BytesIO(CSV_BODY.encode()), 'csv'))
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[0][1]['email'], 'Jon.smit@test.com')
+
+    def test_read_rows_csv_bad_rows(self):
+        body = CSV_BODY + 'Ann,Lee,ann@test.com,0630987600,1990-01-01,extra\n' + 'x' * 200000 + '\n'
+        rows = list(read_rows(io.BytesIO(body.encode()), 'csv'))
+        self.assertEqual([number for number, _, _ in rows], [1, 2, 3, 4, 5])
+        self.assertEqual(rows[3][1:], (None, 'Expected 5 fields, got 6'))
+        self.assertIsNone(rows[4][1])
+        taken, contacts, errors = validate_chunk(iter(rows), 10)
+        self.assertEqual([error['row'] for error in errors], [2, 4, 5])
+
+    def test_is_utf8(self):
+        file = io.BytesIO(CSV_BODY.encode() + 'Ім\'я'.encode('cp1251'))
+        self.assertFalse(is_utf8(file))
+        self.assertEqual(file.tell(), 0)
+        self.assertTrue(is_utf8(io.BytesIO(CSV_BODY.encode('utf-8-sig'))))
+
+    def test_read_rows_ndjson(self):
+        rows = list(read_rows(io.BytesIO(NDJSON_BODY.encode()), 'ndjson'))
+        self.assertEqual([number for number, _, _ in rows], [1, 3])
+        self.assertIsNone(rows[0][2])
+        self.assertIsNotNone(rows[1][2])
+
+    def test_validate_chunk(self):
+        rows = read_rows(io.BytesIO(CSV_BODY.encode()), 'csv')
+        taken, contacts, errors = validate_chunk(rows, 2)
+        self.assertEqual(taken, 2)
+        self.assertEqual([number for number, _ in contacts], [1])
+        self.assertEqual([error['row'] for error in errors], [2])
+        taken, contacts, errors = validate_chunk(rows, 2)
+        self.assertEqual(taken, 1)
+
+    @patch('src.services.importer.cache', AsyncMock())
+    async def test_import_contacts(self):
+        engine = create_engine('sqlite://')
+        Base.metadata.create_all(bind=engine)
+        session = SyncSessionAdapter(sessionmaker(bind=engine)())
+        user = User(username='Serhii', email='sspod@ukr.net', password='0987654321')
+        session.add(user)
+        await session.commit()
+        report = await import_contacts(io.BytesIO(CSV_BODY.encode()), 'csv', user, session)
+        self.assertEqual(report['rows'], 3)
+        self.assertEqual(report['inserted'], 1)
+        self.assertEqual(report['duplicates'], 1)
+        self.assertEqual(report['invalid'], 1)
+        self.assertEqual(report['errors'][1], {'row': 3, 'detail': DUPLICATE_CONTACT})
+        with self.assertRaises(HTTPException) as error:
+            await import_contacts(io.BytesIO(CSV_BODY.encode('utf-16')), 'csv', user, session)
+        self.assertEqual(error.exception.status_code, 400)
+        await session.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
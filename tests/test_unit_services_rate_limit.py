@@ -0,0 +1,111 @@
+import unittest
+from unittest.mock import patch
+
+from fastapi import HTTPException
+
+from src.database.models import User
+from src.services import rate_limit
+from src.services.rate_limit import RateLimit, SlidingWindowLimiter, parse_limit
+
+
+class FakePipeline:
+    def __init__(self, data: dict):
+        self.data = data
+        self.commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+    def incrby(self, key, amount):
+        self.commands.append(('incrby', key, amount))
+        return self
+
+    def expire(self, key, seconds):
+        self.commands.append(('expire', key, seconds))
+        return self
+
+    async def execute(self):
+        results = []
+        for command, key, value in self.commands:
+            if command == 'incrby':
+                self.data[key] = self.data.get(key, 0) + value
+                results.append(self.data[key])
+            else:
+                results.append(True)
+        return results
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+        self.pipelines = 0
+
+    def pipeline(self, transaction=True):
+        self.pipelines += 1
+        return FakePipeline(self.data)
+
+
+class TestRateLimit(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.redis = FakeRedis()
+
+    def test_parse_limit(self):
+        self.assertEqual(parse_limit('5/60'), (5, 60))
+
+    def test_sliding_window(self):
+        limiter = SlidingWindowLimiter(self.redis)
+        start = 600.0
+        self.assertEqual([limiter.hit('k', 5, 60, start + i) for i in range(5)], [0] * 5)
+        self.assertEqual(limiter.hit('k', 5, 60, start + 5), 56)
+        # A quarter into the next window 3.75 of the 5 previous hits still count
+        self.assertEqual(limiter.hit('k', 5, 60, start + 75), 0)
+        self.assertEqual(limiter.hit('k', 5, 60, start + 76), 0)
+        self.assertGreater(limiter.hit('k', 5, 60, start + 77), 0)
+        self.assertEqual(limiter.hit('k', 5, 60, start + 105), 0)
+        self.assertEqual(limiter.hit('other', 5, 60, start + 5), 0)
+        self.assertEqual(self.redis.pipelines, 0)
+
+    async def test_sync_between_workers(self):
+        workers = [SlidingWindowLimiter(self.redis), SlidingWindowLimiter(self.redis)]
+        now = 600.0
+        self.assertEqual([workers[0].hit('k', 5, 60, now) for _ in range(3)], [0] * 3)
+        await workers[0].sync(now)
+        self.assertEqual(self.redis.data['rl:k:10'], 3)
+        self.assertEqual(workers[1].hit('k', 5, 60, now), 0)
+        await workers[1].sync(now)
+        self.assertEqual(self.redis.data['rl:k:10'], 4)
+        self.assertEqual(workers[1].keys['k'][1][10], 4)
+        self.assertEqual(workers[1].hit('k', 5, 60, now), 0)
+        self.assertGreater(workers[1].hit('k', 5, 60, now), 0)
+        await workers[1].sync(now)
+        self.assertEqual(self.redis.data['rl:k:10'], 5)
+        # One pipeline per sync with pending hits, none without
+        pipelines = self.redis.pipelines
+        await workers[1].sync(now)
+        self.assertEqual(workers[1].stats()['syncs'], 2)
+        # Keys idle for two windows are dropped
+        await workers[0].sync(now + 180)
+        self.assertEqual(workers[0].stats()['keys'], 0)
+        self.assertEqual(self.redis.pipelines, pipelines + 2)
+
+    async def test_dependency(self):
+        limiter = SlidingWindowLimiter(self.redis)
+        limit = RateLimit('contacts:create')
+        with patch.object(rate_limit, 'limiter', limiter), \
+                patch.object(rate_limit.settings, 'rate_limits', {'contacts:create': '2/60'}):
+            self.assertEqual(limit.description, '2 requests per minute limit')
+            await limit(User(id=1))
+            await limit(User(id=1))
+            await limit(User(id=2))
+            with self.assertRaises(HTTPException) as error:
+                await limit(User(id=1))
+        self.assertEqual(error.exception.status_code, 429)
+        self.assertIn('Retry-After', error.exception.headers)
+
+
+if __name__ == '__main__':
+    unittest.main()
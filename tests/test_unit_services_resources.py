@@ -0,0 +1,58 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import AsyncMock, MagicMock
+
+from sqlalchemy import text
+
+from src.config.config import settings
+from src.database.db import Database
+from src.services.resources import Resources
+
+
+class TestResources(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp(suffix='.db')
+        os.close(handle)
+
+    def tearDown(self):
+        os.unlink(self.path)
+
+    async def test_database_is_lazy(self):
+        for is_async in (False, True):
+            database = Database(f'sqlite:///{self.path}', is_async)
+            self.assertIsNone(database._engine)
+            self.assertIsNone(database._async_engine)
+            await database.warm(3)
+            if is_async:
+                self.assertIsNone(database._engine)
+                async with database.async_session() as session:
+                    self.assertEqual((await session.execute(text('SELECT 1'))).scalar(), 1)
+            else:
+                self.assertIsNone(database._async_engine)
+                with database.session() as session:
+                    self.assertEqual(session.execute(text('SELECT 1')).scalar(), 1)
+            await database.dispose()
+
+    async def test_open_close(self):
+        database = Database(f'sqlite:///{self.path}', True)
+        resources = Resources(database)
+        redis = MagicMock()
+        redis.ping = AsyncMock(side_effect=ConnectionError('Redis is down'))
+        redis.close = AsyncMock()
+        redis.connection_pool.disconnect = AsyncMock()
+        resources._redis = redis
+        with self.assertLogs('src.services.resources', 'WARNING'):
+            await resources.open()
+        self.assertEqual(len(resources.mail.tasks), settings.mail_workers)
+        self.assertIsNotNone(database._async_engine)
+        await resources.close()
+        redis.close.assert_awaited_once()
+        redis.connection_pool.disconnect.assert_awaited_once()
+        self.assertIsNone(resources._redis)
+        self.assertIsNone(resources._mail)
+
+
+if __name__ == '__main__':
+    unittest.main()
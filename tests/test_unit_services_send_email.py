@@ -0,0 +1,136 @@
+import asyncio
+import socket
+import unittest
+from datetime import date
+
+from aiosmtpd.controller import Controller
+from fastapi_mail import ConnectionConfig
+
+from src.database.models import Contact, User
+from src.services import send_email
+from src.services.send_email import MailQueue, build_message
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def config(port: int) -> ConnectionConfig:
+    return ConnectionConfig(MAIL_USERNAME='', MAIL_PASSWORD='', MAIL_FROM='noreply@example.com', MAIL_PORT=port,
+                            MAIL_SERVER='127.0.0.1', MAIL_STARTTLS=False, MAIL_SSL_TLS=False,
+                            USE_CREDENTIALS=False, VALIDATE_CERTS=False)
+
+
+class Handler:
+    def __init__(self):
+        self.received = []
+        self.replies = []
+        self.sessions = set()
+
+    async def handle_DATA(self, server, session, envelope):
+        self.sessions.add(id(session))
+        if self.replies:
+            return self.replies.pop(0)
+        self.received.append(envelope.rcpt_tos[0])
+        return '250 OK'
+
+
+class TestMailQueue(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        port = free_port()
+        self.handler = Handler()
+        self.controller = Controller(self.handler, hostname='127.0.0.1', port=port)
+        self.controller.start()
+        self.queue = MailQueue(config(port), workers=2, batch_size=10, max_retries=2, retry_delay=0.01)
+
+    def tearDown(self):
+        self.controller.stop()
+
+    def message(self, number: int):
+        return build_message(f'user{number}@example.com', 'Test', 'email_template.html',
+                             {'host': 'http://localhost/', 'username': f'user{number}', 'token': 'token'})
+
+    async def test_send_reuses_connections(self):
+        for number in range(30):
+            self.assertTrue(self.queue.put(self.message(number)))
+        await self.queue.start()
+        await asyncio.wait_for(self.queue.queue.join(), 5)
+        for number in range(30, 35):
+            self.queue.put(self.message(number))
+        await asyncio.wait_for(self.queue.queue.join(), 5)
+        stats = self.queue.stats()
+        await self.queue.stop()
+        self.assertCountEqual(self.handler.received, [f'user{number}@example.com' for number in range(35)])
+        self.assertEqual(stats['sent'], 35)
+        self.assertEqual(stats['queued'], 0)
+        self.assertLessEqual(stats['connects'], 2)
+        self.assertEqual(len(self.handler.sessions), stats['connects'])
+        self.assertEqual(self.queue.stats()['connections'], 0)
+
+    async def test_retry_and_give_up(self):
+        self.handler.replies = ['451 Try again later', '550 No such user']
+        await self.queue.start()
+        self.queue.put(self.message(1))
+        self.queue.put(self.message(2))
+        with self.assertLogs('src.services.send_email', 'ERROR') as logs:
+            for _ in range(100):
+                if self.queue.stats()['sent'] == 1 and not self.queue.retrying:
+                    break
+                await asyncio.sleep(0.01)
+        stats = self.queue.stats()
+        await self.queue.stop()
+        self.assertIn('failed after 1 attempts', logs.output[0])
+        self.assertEqual(len(self.handler.received), 1)
+        self.assertEqual((stats['sent'], stats['retried'], stats['failed']), (1, 1, 1))
+
+    async def test_connection_refused(self):
+        self.queue = MailQueue(config(free_port()), workers=1, max_retries=2, retry_delay=0.01)
+        self.queue.put(self.message(1))
+        await self.queue.start()
+        for _ in range(100):
+            if self.queue.stats()['failed']:
+                break
+            await asyncio.sleep(0.01)
+        stats = self.queue.stats()
+        await self.queue.stop()
+        self.assertEqual((stats['sent'], stats['retried'], stats['failed']), (0, 2, 1))
+
+    def test_queue_full(self):
+        queue = MailQueue(max_size=1)
+        self.assertTrue(queue.put(self.message(1)))
+        with self.assertLogs('src.services.send_email', 'WARNING') as logs:
+            self.assertFalse(queue.put(self.message(2)))
+        self.assertIn('user2@example.com', logs.output[0])
+        self.assertEqual(queue.stats()['dropped'], 1)
+
+
+class TestTemplates(unittest.TestCase):
+
+    def test_render_many(self):
+        contexts = [{'host': 'http://localhost/', 'username': f'user{number}', 'token': f'token{number}'}
+                    for number in range(3)]
+        bodies = list(send_email.render_many('email_template.html', contexts))
+        self.assertEqual(len(bodies), 3)
+        for body, context in zip(bodies, contexts):
+            self.assertIn(f"api/auth/confirmed_email/{context['token']}", body)
+            message = build_message('user@example.com', 'Test', 'email_template.html', context)
+            self.assertEqual(message.get_payload(decode=True).decode(), body)
+        body = next(send_email.render_many('email_template.html', [{'username': '<b>Serhii</b>'}]))
+        self.assertIn('&lt;b&gt;Serhii&lt;/b&gt;', body)
+
+    def test_birthday_reminders(self):
+        users = [User(username='Serhii', email='sspod@ukr.net'), User(username='Jon', email='jon@test.com')]
+        contacts = [Contact(name='Lina', surname='Norington', birthday=date(1990, 10, 20))]
+        messages = list(send_email.birthday_reminders([(users[0], contacts), (users[1], [])]))
+        self.assertEqual(len(messages), 1)
+        self.assertEqual(messages[0]['To'], 'sspod@ukr.net')
+        body = messages[0].get_payload(decode=True).decode()
+        self.assertIn('Hi Serhii', body)
+        self.assertIn('Lina Norington: 20 October', body)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import unittest
+from datetime import datetime
+from unittest.mock import patch
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from src.database.db import SyncSessionAdapter
+from src.database.models import Base, Contact, User
+from src.repository.contacts import get_contacts, response_columns, RESPONSE_COLUMNS
+from src.services import serializer
+
+
+class TestSerializer(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        engine = create_engine('sqlite://')
+        Base.metadata.create_all(bind=engine)
+        with engine.begin() as connection:
+            connection.execute(insert(Contact), [
+                {'name': 'Jon', 'surname': 'Smit', 'email': 'Jon.smit@test.com', 'phone': '0630987654',
+                 'birthday': datetime(1990, 2, 28, 13, 30), 'user_id': 1},
+                {'name': 'Ліна "Q" \\ \x01', 'surname': 'Нортон 😀', 'email': 'lina@test.com', 'phone': '0630987653',
+                 'birthday': datetime(2000, 2, 29), 'user_id': 1},
+            ])
+        self.session = SyncSessionAdapter(sessionmaker(bind=engine)())
+        self.user = User(id=1)
+
+    async def asyncTearDown(self):
+        await self.session.close()
+
+    async def test_fast_json_is_byte_identical(self):
+        contacts = await get_contacts(self.user, self.session)
+        rows = await get_contacts(self.user, self.session, columns=RESPONSE_COLUMNS)
+        expected = serializer.render_contacts(contacts)
+        expected_one = serializer.render_contacts(contacts[1], many=False)
+        expected_lines = serializer.render_lines(contacts)
+        for encoder in (serializer.orjson, None):
+            with patch.object(serializer.settings, 'fast_json', True), patch.object(serializer, 'orjson', encoder):
+                self.assertEqual(serializer.render_contacts(rows), expected)
+                self.assertEqual(serializer.render_contacts(rows[1], many=False), expected_one)
+                self.assertEqual(serializer.render_lines(rows), expected_lines)
+
+    async def test_sparse_fields(self):
+        rows = await get_contacts(self.user, self.session, columns=response_columns(('birthday',)))
+        self.assertEqual(serializer.render_contacts(rows, fields=('birthday', 'id')),
+                         '[{"birthday":"1990-02-28","id":1},{"birthday":"2000-02-29","id":2}]')
+        self.assertEqual(serializer.render_lines(rows[:1], fields=('birthday', 'id')),
+                         '{"birthday": "1990-02-28", "id": 1}\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
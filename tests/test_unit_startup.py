@@ -0,0 +1,40 @@
+import os
+import subprocess
+import sys
+import unittest
+from pathlib import Path
+
+from benchmarks.bench_startup import ROOT, import_times, report, total_ms
+
+# Best of three cold imports of main, in milliseconds of -X importtime (which adds some overhead of its own)
+STARTUP_BUDGET_MS = float(os.environ.get('STARTUP_BUDGET_MS', 1200))
+# Written on every run, so CI can keep it as an artifact
+REPORT_PATH = Path(os.environ.get('IMPORTTIME_REPORT', ROOT / 'importtime_report.txt'))
+LAZY_MODULES = ('cloudinary', 'fastapi_mail', 'libgravatar', 'PIL', 'httpx', 'uvicorn')
+
+
+class TestStartup(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.entries = min((import_times('main') for _ in range(3)), key=total_ms)
+        cls.report = report(cls.entries)
+        REPORT_PATH.write_text(cls.report)
+
+    def test_startup_budget(self):
+        self.assertLess(total_ms(self.entries), STARTUP_BUDGET_MS, self.report)
+
+    def test_integrations_are_lazy(self):
+        imported = {name.strip().split('.')[0] for _, _, name in self.entries}
+        for module in LAZY_MODULES:
+            self.assertNotIn(module, imported)
+
+    def test_no_connections_at_import(self):
+        code = ('import main; from src.database.db import database; from src.services.resources import resources; '
+                'print(database._engine, database._async_engine, resources._redis, resources._mail)')
+        result = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True, check=True)
+        self.assertEqual(result.stdout.split(), ['None'] * 4)
+
+
+if __name__ == '__main__':
+    unittest.main()